@@ -0,0 +1,765 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+from pymongo import monitoring
+from telegram import Bot, Update
+from telegram.request import BaseRequest
+
+import metrics
+from fingerprint import Fingerprint
+from query_profiler import QueryProfiler, assert_max_queries, patch_collection_class
+
+# Settings bot.py expects; a real .env is never needed for a benchmark run
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("ADMIN_CHAT_ID", "-1000000000001")
+os.environ.setdefault("CHANNEL_ID", "-1000000000002")
+os.environ.setdefault("BOT_USERNAME", "bench_bot")
+os.environ.setdefault("DB_NAME", "confession_bench")
+
+import bot
+
+CHANNEL_CHAT_ID = int(os.environ["CHANNEL_ID"])
+SCENARIOS = {}
+# Most Mongo commands one update (and one reaction flush) may issue in each scenario
+QUERY_BUDGETS = {}
+# Scenarios using queries mongomock can't run ($text search); skipped without --mongo-uri
+MONGOD_ONLY = set()
+# Vocabulary for synthetic confession texts
+WORDS = (
+    "i never told anyone that my best friend crush teacher mother brother sister school exam "
+    "money phone night party secret lied stole broke cried laughed love hate miss afraid happy "
+    "sorry every time we went home late because still think about it when nobody was there"
+).split()
+
+
+# Fake Bot API: answers every request locally and counts calls per method
+class StubRequest(BaseRequest):
+    def __init__(self):
+        self.calls = {}
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        params = request_data.parameters if request_data else {}
+        if endpoint in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            self._message_id += 1
+            chat_id = params.get("chat_id", CHANNEL_CHAT_ID)
+            result = {
+                "message_id": params.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif endpoint == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# Minimal stand-in for CallbackContext: the handlers only use bot, args and user_data
+class BenchContext:
+    def __init__(self, bot_instance, user_data, args=None):
+        self.bot = bot_instance
+        self.user_data = user_data
+        self.args = args or []
+
+
+# Synthetic updates built through Update.de_json so the handlers get real objects
+class UpdateFactory:
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self.update_id = 0
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def _message(self, user_id, text=None):
+        data = {
+            "message_id": self._next_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        }
+        if text is not None:
+            data["text"] = text
+        return data
+
+    def text(self, user_id, text):
+        return Update.de_json({"update_id": self._next_id(), "message": self._message(user_id, text)}, self.bot)
+
+    def callback(self, user_id, data):
+        query = {
+            "id": str(self._next_id()),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": self._message(user_id, "previous message"),
+        }
+        return Update.de_json({"update_id": self._next_id(), "callback_query": query}, self.bot)
+
+
+def open_database(mongo_uri, stack):
+    if mongo_uri:
+        from pymongo import MongoClient
+        from mongo_listeners import ProfilerListener
+        client = MongoClient(mongo_uri, event_listeners=[ProfilerListener()])
+        stack.callback(client.close)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+        stack.enter_context(patch_collection_class(mongomock.collection.Collection))
+    client.drop_database(os.environ["DB_NAME"])
+    return client[os.environ["DB_NAME"]]
+
+
+# Runs updates one at a time and records latency and Mongo commands for each
+class Runner:
+    def __init__(self, bot_instance, request, max_queries=None, max_flush_queries=None):
+        self.bot = bot_instance
+        self.request = request
+        # Going over either budget raises, with the per-call-site report of the offending update
+        self.max_queries = max_queries
+        self.max_flush_queries = max_flush_queries
+        self.updates = UpdateFactory(bot_instance)
+        self.user_data = {}
+        self.latencies = []
+        self.db_ops = []
+        # Work deferred past the handlers (debounced reactions), measured when flushed
+        self.deferred_seconds = 0.0
+        self.deferred_db_ops = 0
+
+    async def send(self, handler, update, user_id, args=None):
+        context = BenchContext(self.bot, self.user_data.setdefault(user_id, {}), args)
+        label = update.callback_query.data if update.callback_query else update.message.text
+        with self._budget(self.max_queries, f"{handler.__name__} ({label})") as profiler:
+            start = time.perf_counter()
+            await handler(update, context)
+            self.latencies.append(time.perf_counter() - start)
+        self.db_ops.append(profiler.count)
+
+    async def start(self, user_id, args=None):
+        text = "/start" + (" " + " ".join(args) if args else "")
+        await self.send(bot.start, self.updates.text(user_id, text), user_id, args)
+
+    async def tap(self, user_id, data):
+        await self.send(bot.button_handler, self.updates.callback(user_id, data), user_id)
+
+    async def say(self, user_id, text):
+        await self.send(bot.confession_text, self.updates.text(user_id, text), user_id)
+
+    # Stand-in for the debounce window elapsing
+    async def flush_reactions(self):
+        with self._budget(self.max_flush_queries, "reaction flush") as profiler:
+            start = time.perf_counter()
+            await bot.reaction_debouncer.flush_all()
+            self.deferred_seconds += time.perf_counter() - start
+        self.deferred_db_ops += profiler.count
+
+    def _budget(self, limit, label):
+        return QueryProfiler(label) if limit is None else assert_max_queries(limit, label)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Throughput is over time spent inside handlers; seeding is not measured
+def summarize(name, runner, telegram_calls, shed):
+    latencies = sorted(runner.latencies)
+    count = len(latencies)
+    busy_seconds = sum(latencies)
+    return {
+        "scenario": name,
+        "updates": count,
+        "handler_seconds": round(busy_seconds, 4),
+        "throughput_per_second": round(count / busy_seconds, 2) if busy_seconds else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p90": round(_percentile(latencies, 90) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "db_ops": {
+            "total": sum(runner.db_ops) + runner.deferred_db_ops,
+            "per_update_mean": round(sum(runner.db_ops) / count, 2) if count else 0.0,
+            "per_update_max": max(runner.db_ops, default=0),
+            "deferred": runner.deferred_db_ops,
+        },
+        "deferred_seconds": round(runner.deferred_seconds, 4),
+        "shed_updates": shed,
+        "telegram_calls": dict(sorted(telegram_calls.items())),
+    }
+
+
+def scenario(name, max_queries, max_flush_queries=0, mongod_only=False):
+    def decorator(func):
+        SCENARIOS[name] = func
+        QUERY_BUDGETS[name] = (max_queries, max_flush_queries)
+        if mongod_only:
+            MONGOD_ONLY.add(name)
+        return func
+    return decorator
+
+
+# Seed helpers write straight through bot.py's data layer
+def seed_approved_confession(author_id, text="Benchmark confession"):
+    bot.get_or_create_user(author_id)
+    confession_id = bot.add_confession(author_id, text, status="approved", categories=["others"])
+    bot.index_approved_confession({"confession_id": confession_id, "text": text, "categories": ["others"]})
+    bot.store_channel_post(confession_id, 1)
+    return confession_id
+
+
+def random_text(rng, words=40):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def seed_comments(confession_id, count, rng, first_user_id=10_000):
+    comment_ids = []
+    for i in range(count):
+        user_id = first_user_id + i % 200
+        bot.get_or_create_user(user_id)
+        if comment_ids and rng.random() < 0.3:
+            reply_id, _ = bot.add_reply_to_comment(rng.choice(comment_ids), user_id, f"reply {i}")
+        else:
+            comment_ids.append(bot.add_comment_to_confession(confession_id, user_id, f"comment {i}"))
+    return comment_ids
+
+
+# Many distinct users open the same confession from the channel post
+@scenario("viral_deep_link", max_queries=4)
+async def viral_deep_link(runner, rng, scale):
+    confession_id = seed_approved_confession(1)
+    seed_comments(confession_id, 20, rng)
+    for i in range(500 * scale):
+        await runner.start(100_000 + i, [f"confession_{confession_id}"])
+
+
+# Opening a large thread: every comment and reply is sent as its own message.
+# The budget is the archive probe, the thread and one lookup for all its authors,
+# however long the thread is.
+@scenario("thread_view_500", max_queries=3)
+async def thread_view_500(runner, rng, scale):
+    confession_id = seed_approved_confession(1)
+    seed_comments(confession_id, 500, rng)
+    for i in range(5 * scale):
+        await runner.tap(200_000 + i, f"view_comments_{confession_id}")
+
+
+# Many users hammering like/dislike on a handful of comments, often several taps in a row.
+# Taps only touch memory; each flush may spend at most three commands per tap since the last one.
+@scenario("like_storm", max_queries=0, max_flush_queries=150)
+async def like_storm(runner, rng, scale):
+    confession_id = seed_approved_confession(1)
+    comment_ids = seed_comments(confession_id, 10, rng)
+    users = [300_000 + i for i in range(100)]
+    taps = 0
+    while taps < 1000 * scale:
+        user_id, comment_id = rng.choice(users), rng.choice(comment_ids)
+        for _ in range(rng.choice([1, 1, 2, 3, 4])):
+            action = "like_comment_" if rng.random() < 0.7 else "dislike_comment_"
+            await runner.tap(user_id, f"{action}{comment_id}")
+            taps += 1
+            # Roughly one debounce window's worth of taps between flushes
+            if taps % 50 == 0:
+                await runner.flush_reactions()
+    await runner.flush_reactions()
+
+
+# Users writing, categorising and submitting confessions back to back
+@scenario("confession_burst", max_queries=7)
+async def confession_burst(runner, rng, scale):
+    categories = ["family", "friendship", "crush", "school", "mental", "others"]
+    for i in range(100 * scale):
+        user_id = 400_000 + i
+        await runner.start(user_id)
+        await runner.say(user_id, f"Confession number {i} written at {datetime.now():%H:%M:%S}")
+        await runner.tap(user_id, "submit_confess")
+        for category in rng.sample(categories, 3):
+            await runner.tap(user_id, f"category_{category}")
+        await runner.tap(user_id, "final_submit")
+
+
+# Users sending the same confession again, then a lightly edited copy
+@scenario("resubmit", max_queries=7)
+async def resubmit(runner, rng, scale):
+    for i in range(50 * scale):
+        user_id = 450_000 + i
+        text = random_text(rng)
+        for body in (text, text, text + " Please post this one."):
+            await runner.start(user_id)
+            await runner.say(user_id, body)
+            await runner.tap(user_id, "submit_confess")
+            for category in ("crush", "school", "others"):
+                await runner.tap(user_id, f"category_{category}")
+            await runner.tap(user_id, "final_submit")
+
+
+# Readers paging through a large archive, unfiltered and by category
+@scenario("browse_archive", max_queries=1)
+async def browse_archive(runner, rng, scale):
+    for i in range(2000 * scale):
+        categories = rng.sample(bot.CONFESSION_CATEGORIES, 3)
+        bot.index_approved_confession({"confession_id": i + 1, "text": f"Archived confession {i}", "categories": categories})
+    for i in range(100 * scale):
+        user_id = 500_000 + i
+        await runner.tap(user_id, "browse_confessions")
+        before_id = 2000 * scale
+        for _ in range(3):
+            before_id -= bot.BROWSE_PAGE_SIZE
+            await runner.tap(user_id, f"browse_page_{before_id + 1}_")
+        await runner.tap(user_id, f"browse_cat_{rng.choice(bot.CONFESSION_CATEGORIES)}")
+
+
+# Readers searching the archive and paging through the matches. Every result shown
+# must contain one of the search words.
+@scenario("search_archive", max_queries=2, mongod_only=True)
+async def search_archive(runner, rng, scale):
+    for i in range(2000 * scale):
+        bot.index_approved_confession({"confession_id": i + 1, "text": random_text(rng), "categories": ["others"]})
+    for i in range(100 * scale):
+        user_id = 550_000 + i
+        terms = rng.sample(WORDS, 2)
+        await runner.tap(user_id, "browse_search")
+        await runner.say(user_id, " ".join(terms))
+        results = runner.user_data[user_id]["search_results"]
+        assert 0 < len(results) <= bot.SEARCH_MAX_RESULTS, terms
+        for offset in range(bot.BROWSE_PAGE_SIZE, 3 * bot.BROWSE_PAGE_SIZE, bot.BROWSE_PAGE_SIZE):
+            await runner.tap(user_id, f"search_page_{offset}")
+        shown, _ = bot.search_results_page(results, 0, len(results))
+        assert [conf["confession_id"] for conf in shown] == results, terms
+        assert all(set(terms) & set(conf["text"].lower().rstrip(".").split()) for conf in shown), terms
+
+
+# Old thread moved to the archive, then opened from the channel post and read in full.
+# Reading costs what a live thread does; the budget is set by withdrawing it on rejection.
+@scenario("archived_thread", max_queries=5)
+async def archived_thread(runner, rng, scale):
+    confession_id = seed_approved_confession(1)
+    seed_comments(confession_id, 500, rng)
+    bot.users_collection.update_one(
+        {"confessions.confession_id": confession_id},
+        {"$set": {"confessions.$.timestamp": datetime.now() - timedelta(days=bot.ARCHIVE_AFTER_DAYS + 1)}}
+    )
+    assert bot.archive_old_confessions() == 1
+    for i in range(5 * scale):
+        user_id = 600_000 + i
+        await runner.start(user_id, [f"confession_{confession_id}"])
+        await runner.tap(user_id, f"view_comments_{confession_id}")
+    # Moderating it again once archived: a repeat approval changes nothing, a rejection hides it
+    bot.store_fingerprint(confession_id, 1, Fingerprint("Benchmark confession"), "approved", datetime.now())
+    bot.update_stats()
+    admin_id = int(os.environ["ADMIN_CHAT_ID"])
+    for action in ("approve", "reject", "reject"):
+        await runner.tap(admin_id, f"{action}_{confession_id}")
+    assert bot.get_confession_by_id(confession_id) is None
+    bot.update_stats()
+    check_stats_rollups()
+    await runner.tap(admin_id, f"approve_{confession_id}")
+    assert bot.get_confession_by_id(confession_id)["archived"]
+    bot.update_stats()
+    check_stats_rollups()
+
+
+# One user hammering a big thread and a reaction button while others browse normally.
+# Updates run back to back here, far faster than real taps, so this shows the limiter's ceiling.
+# How many taps get through depends on wall-clock refill, so the final flush may apply one net
+# reaction (7 commands) or find they cancelled out.
+@scenario("flood", max_queries=4, max_flush_queries=7)
+async def flood(runner, rng, scale):
+    bot.flood_guard.enabled = True
+    confession_id = seed_approved_confession(1)
+    comment_ids = seed_comments(confession_id, 500, rng)
+    for i in range(100 * scale):
+        await runner.tap(700_000, f"view_comments_{confession_id}")
+        await runner.tap(700_001, f"like_comment_{comment_ids[0]}")
+        await runner.start(700_100 + i, [f"confession_{confession_id}"])
+    await runner.flush_reactions()
+
+
+# Confessions, comments and moderation decisions arriving between stats runs, then
+# admins reading /stats. The rollups must match a direct count after every run.
+@scenario("admin_stats", max_queries=7)
+async def admin_stats(runner, rng, scale):
+    bot.update_stats()
+    for i in range(20 * scale):
+        user_id = 460_000 + i
+        await runner.start(user_id)
+        await runner.say(user_id, random_text(rng))
+        await runner.tap(user_id, "submit_confess")
+        for category in ("crush", "school", "others"):
+            await runner.tap(user_id, f"category_{category}")
+        await runner.tap(user_id, "final_submit")
+    confession_id = seed_approved_confession(1)
+    seed_comments(confession_id, 100 * scale, rng)
+    bot.update_stats()
+    check_stats_rollups()
+    # Moderation: repeated presses, reversals, and several changes between two stats runs
+    admin_id = int(os.environ["ADMIN_CHAT_ID"])
+    pending = [doc["_id"] for doc in bot.fingerprints_collection.find({"status": "pending"}, {"_id": 1})]
+    for decided in pending:
+        for action in rng.choice([["approve"], ["reject"], ["approve", "approve"], ["approve", "reject"]]):
+            await runner.tap(admin_id, f"{action}_{decided}")
+    bot.update_stats()
+    check_stats_rollups()
+    for decided in pending:
+        for action in rng.choice([[], ["reject"], ["reject", "approve"], ["approve", "reject", "approve"]]):
+            await runner.tap(admin_id, f"{action}_{decided}")
+    bot.update_stats()
+    check_stats_rollups()
+    # A recount (first poll, lost stream history) lands every day where the runs did, active users included,
+    # and users it already counted today aren't counted again afterwards
+    counted = stats_rollups()
+    bot.rebuild_stats(pending=not bot.change_streams_available())
+    assert stats_rollups() == counted, "recount differs from the incremental rollups"
+    seed_comments(confession_id, 10, rng)
+    bot.update_stats()
+    today = f"day:{bot.stats_day(datetime.now())}"
+    assert stats_rollups()[today]["active_users"] == counted[today]["active_users"], stats_rollups()[today]
+    for _ in range(20 * scale):
+        await runner.send(bot.stats_command, runner.updates.text(admin_id, "/stats"), admin_id)
+
+
+# Rollup documents without their zero counts, for comparing two ways of computing them
+def stats_rollups():
+    return {
+        doc.pop("_id"): {field: value for field, value in doc.items() if value}
+        for doc in bot.stats_collection.find({"_id": {"$regex": "^(total|day:)"}})
+    }
+
+
+# The rollups must match a direct count of the source collections
+def check_stats_rollups():
+    total = bot.stats_collection.find_one({"_id": "total"})
+    assert total["submitted"] == bot.fingerprints_collection.count_documents({}), total
+    archived_comments = sum(doc["comment_count"] for doc in bot.archived_confessions_collection.find({}, {"comment_count": 1}))
+    assert total["comments"] == bot.comments_collection.count_documents({}) + archived_comments, total
+    assert total["new_users"] == bot.users_collection.count_documents({}), total
+    for status in ("approved", "rejected"):
+        assert total.get(status, 0) == bot.fingerprints_collection.count_documents({"status": status}), (status, total)
+    days = bot.stats_collection.find({"_id": {"$regex": "^day:"}})
+    assert sum(day.get("approved", 0) for day in days) == total.get("approved", 0), total
+    # Every browsable confession counts once in each of its categories
+    tagged = sum(len(doc.get("categories", [])) for doc in bot.confessions_collection.find({}, {"categories": 1}))
+    assert sum(counts.get("approved", 0) for counts in bot.get_category_counts().values()) == tagged, tagged
+
+
+async def run_scenario(name, mongo_uri, seed, scale):
+    with ExitStack() as stack:
+        bot.use_database(open_database(mongo_uri, stack))
+        bot.ensure_indexes()
+        # Scenarios replay updates far faster than people tap; only "flood" measures the limiter
+        bot.flood_guard.enabled = False
+        shed_before = metrics.SHED_UPDATES.total()
+        request = StubRequest()
+        bot_instance = Bot(os.environ["BOT_TOKEN"], request=request, get_updates_request=StubRequest())
+        runner = Runner(bot_instance, request, *QUERY_BUDGETS[name])
+        await SCENARIOS[name](runner, random.Random(seed), scale)
+        return summarize(name, runner, request.calls, metrics.SHED_UPDATES.total() - shed_before)
+
+
+# Import bot.py in a fresh interpreter: time it and check it started nothing
+IMPORT_PROBE = """
+import threading, time
+start = time.perf_counter()
+import bot
+elapsed = time.perf_counter() - start
+print(round(elapsed * 1000, 1), threading.active_count(), bot._client is None)
+"""
+
+
+def measure_import(runs=5):
+    samples = []
+    side_effects = False
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        ms, threads, no_client = result.stdout.split()
+        samples.append(float(ms))
+        side_effects = side_effects or int(threads) > 1 or no_client != "True"
+    return {
+        "runs": runs,
+        "best_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "side_effects": side_effects,
+    }
+
+
+# Duplicate lookups against a large fingerprint index. The first few thousand entries are
+# real texts; the rest are filler with random keys, since lookup cost depends on the size
+# of the index, not on the text behind each entry. mongomock has no indexes and scans
+# every document, so query times only mean something with --mongo-uri.
+def check_fingerprint_lookups(mongo_uri, corpus, seed, lookups=1000):
+    from fingerprint import BANDS, ROWS
+    rng = random.Random(seed)
+    with ExitStack() as stack:
+        bot.use_database(open_database(mongo_uri, stack))
+        bot.ensure_indexes()
+        texts = [random_text(rng) for _ in range(min(corpus, 5000))]
+        filler_signature = [rng.getrandbits(61) for _ in range(BANDS * ROWS)]
+        batch = []
+        for i in range(corpus):
+            if i < len(texts):
+                fingerprint = Fingerprint(texts[i])
+                doc = {"exact": fingerprint.exact, "bands": fingerprint.bands, "signature": fingerprint.signature}
+            else:
+                doc = {
+                    "exact": f"{rng.getrandbits(128):032x}",
+                    "bands": [f"{band}:{rng.getrandbits(64):016x}" for band in range(BANDS)],
+                    "signature": filler_signature,
+                }
+            batch.append({"_id": i + 1, "user_id": i, "status": "approved", **doc})
+            if len(batch) == 10_000:
+                bot.fingerprints_collection.insert_many(batch)
+                batch = []
+        if batch:
+            bot.fingerprints_collection.insert_many(batch)
+
+        hashing = querying = 0.0
+        found = false_positives = ops = 0
+        for i in range(lookups):
+            near = i % 2 == 0
+            if near:
+                words = rng.choice(texts).split()
+                words.insert(rng.randrange(len(words)), rng.choice(WORDS))
+                text = " ".join(words)
+            else:
+                text = random_text(rng)
+            start = time.perf_counter()
+            fingerprint = Fingerprint(text)
+            hashed = time.perf_counter()
+            with QueryProfiler() as profiler:
+                duplicates = bot.find_duplicates(fingerprint)
+            querying += time.perf_counter() - hashed
+            hashing += hashed - start
+            ops += profiler.count
+            if near:
+                found += bool(duplicates)
+            else:
+                false_positives += bool(duplicates)
+        report = {
+            "corpus": corpus,
+            "lookups": lookups,
+            "fingerprint_ms_mean": round(hashing / lookups * 1000, 3),
+            "query_ms_mean": round(querying / lookups * 1000, 3),
+            "db_ops_per_lookup": round(ops / lookups, 2),
+            "near_duplicates_found": f"{found}/{lookups - lookups // 2}",
+            "false_positives": false_positives,
+        }
+        if mongo_uri:
+            # The band probe; the exact probe is a single-key lookup
+            stats = bot.fingerprints_collection.find(
+                {"bands": {"$in": fingerprint.bands}, "_id": {"$nin": []}}
+            ).explain()["executionStats"]
+            report["keys_examined_per_lookup"] = stats["totalKeysExamined"]
+            report["docs_examined_per_lookup"] = stats["totalDocsExamined"]
+        return report
+
+
+# One replica contending for a lease: prints "start end" (wall clock) for every window it held it
+LEASE_PROBE = """
+import sys, time
+from pymongo import MongoClient
+from lease import Lease
+uri, db, owner, ttl, seconds = sys.argv[1:6]
+lease = Lease(MongoClient(uri)[db]["leases"], "lease_check", owner, float(ttl))
+end = time.time() + float(seconds)
+while time.time() < end:
+    start = time.time()
+    if lease.acquire():
+        print(start, start + float(ttl), flush=True)
+    time.sleep(float(ttl) / 3)
+"""
+
+
+# Several processes share one lease on a real mongod; the holder is killed halfway.
+# Passes if no two owners' windows overlap and another replica takes over.
+def check_leases(mongo_uri, replicas, ttl=3.0, seconds=15.0):
+    from pymongo import MongoClient
+    from lease import Lease
+    db_name = os.environ["DB_NAME"]
+    client = MongoClient(mongo_uri)
+    client[db_name]["leases"].delete_many({"_id": "lease_check"})
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    procs = {
+        f"replica-{i}": subprocess.Popen(
+            [sys.executable, "-c", LEASE_PROBE, mongo_uri, db_name, f"replica-{i}", str(ttl), str(seconds)],
+            stdout=subprocess.PIPE, text=True, cwd=cwd
+        )
+        for i in range(replicas)
+    }
+    time.sleep(seconds / 2)
+    victim = Lease(client[db_name]["leases"], "lease_check", "observer").holder()
+    killed_at = time.time()
+    if victim:
+        procs[victim].kill()
+    windows = []
+    for owner, proc in procs.items():
+        out, _ = proc.communicate()
+        windows.extend((float(start), float(end), owner) for start, end in (line.split() for line in out.splitlines()))
+    client.close()
+    windows.sort()
+    overlaps = sum(1 for a, b in zip(windows, windows[1:]) if a[2] != b[2] and b[0] < a[1])
+    takeover = next((start for start, _, owner in windows if start > killed_at and owner != victim), None)
+    return {
+        "replicas": replicas,
+        "ttl_seconds": ttl,
+        "killed": victim,
+        "owners": sorted({owner for _, _, owner in windows}),
+        "overlapping_windows": overlaps,
+        "failover_seconds": round(takeover - killed_at, 2) if takeover else None,
+    }
+
+
+# Which server each "find" on the comments collection went to
+class ReadTargetListener(monitoring.CommandListener):
+    def __init__(self):
+        self.addresses = []
+
+    def started(self, event):
+        if event.command_name == "find" and event.command.get("find") == "comments":
+            self.addresses.append(event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Against a replica set: each round adds a comment, then reads the thread back with the
+# "thread" read preference, with and without the author's causal session
+def check_read_your_writes(mongo_uri, rounds=200):
+    from pymongo import MongoClient
+    listener = ReadTargetListener()
+    client = MongoClient(mongo_uri, event_listeners=[listener], **bot.POOL_OPTIONS)
+    client.drop_database(os.environ["DB_NAME"])
+    bot._client = client
+    bot.use_database(client[os.environ["DB_NAME"]])
+    bot.ensure_indexes()
+    client.admin.command("ping")
+    if not bot.causal_reads_enabled():
+        sys.exit("--read-check needs --mongo-uri to point at a replica set")
+    author = 900_000
+    confession_id = seed_approved_confession(author)
+    missed_with_session = missed_without_session = 0
+    for i in range(rounds):
+        with bot.causal_session([author]):
+            comment_id = bot.add_comment_to_confession(confession_id, author, f"round {i}")
+        with bot.causal_session([author]):
+            seen = {c["comment_id"] for c in bot.get_comments_for_confession(confession_id)[0]}
+        missed_with_session += comment_id not in seen
+        comment_id = bot.add_comment_to_confession(confession_id, author, f"round {i}, no session")
+        seen = {c["comment_id"] for c in bot.get_comments_for_confession(confession_id)[0]}
+        missed_without_session += comment_id not in seen
+    primary = client.primary
+    secondary_reads = sum(1 for address in listener.addresses if address != primary)
+    client.close()
+    bot._client = None
+    return {
+        "rounds": rounds,
+        "read_preference": bot.READ_PREFERENCES.get("thread", "primary"),
+        "reads_on_secondaries": secondary_reads,
+        "reads_on_primary": len(listener.addresses) - secondary_reads,
+        "own_writes_missed_with_session": missed_with_session,
+        "own_writes_missed_without_session": missed_without_session,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark for the confession bot handlers.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI"),
+                        help="local mongod to run against (default: in-memory mongomock)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--scale", type=int, default=1, help="multiply the number of updates per scenario")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")),
+                        help="fail if importing bot.py takes longer than this (best of 5 runs) or starts threads/clients; "
+                             "0 skips the check")
+    parser.add_argument("--fingerprint-corpus", type=int, default=0, metavar="SIZE",
+                        help="also time duplicate lookups against SIZE stored fingerprints (e.g. 1000000 on a mongod)")
+    parser.add_argument("--read-check", action="store_true",
+                        help="also check read-your-writes with secondary reads (--mongo-uri must be a replica set)")
+    parser.add_argument("--lease-check", type=int, default=0, metavar="REPLICAS",
+                        help="also run REPLICAS processes contending for a leader lease on --mongo-uri")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if args.lease_check and not args.mongo_uri:
+        parser.error("--lease-check needs --mongo-uri: the processes must share one mongod")
+    if args.read_check and not args.mongo_uri:
+        parser.error("--read-check needs --mongo-uri pointing at a replica set")
+    if not args.mongo_uri and MONGOD_ONLY & set(args.scenarios):
+        parser.error(f"{', '.join(sorted(MONGOD_ONLY & set(args.scenarios)))} need --mongo-uri: mongomock has no $text search")
+    names = args.scenarios or [name for name in SCENARIOS if args.mongo_uri or name not in MONGOD_ONLY]
+
+    scenarios = []
+    for name in names:
+        # Query budgets and the scenarios' own checks both fail with AssertionError
+        try:
+            scenarios.append(asyncio.run(run_scenario(name, args.mongo_uri, args.seed, args.scale)))
+        except AssertionError as exc:
+            sys.exit(f"{name} failed: {exc}")
+    report = {
+        "backend": "mongod" if args.mongo_uri else "mongomock",
+        "seed": args.seed,
+        "scale": args.scale,
+        "python": sys.version.split()[0],
+        "scenarios": scenarios,
+        "skipped": [name for name in SCENARIOS if name not in names and not args.scenarios],
+    }
+    if args.import_budget_ms:
+        report["import"] = measure_import()
+        report["import"]["budget_ms"] = args.import_budget_ms
+    if args.fingerprint_corpus:
+        report["fingerprints"] = check_fingerprint_lookups(args.mongo_uri, args.fingerprint_corpus, args.seed)
+    if args.lease_check:
+        report["lease"] = check_leases(args.mongo_uri, args.lease_check)
+    if args.read_check:
+        report["read_your_writes"] = check_read_your_writes(args.mongo_uri)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.import_budget_ms:
+        if report["import"]["side_effects"]:
+            sys.exit("importing bot.py started threads or created a MongoClient")
+        if report["import"]["best_ms"] > args.import_budget_ms:
+            sys.exit(f"importing bot.py took {report['import']['best_ms']} ms (budget {args.import_budget_ms} ms)")
+    if args.read_check and report["read_your_writes"]["own_writes_missed_with_session"]:
+        sys.exit("an author did not see their own comment inside a causal session")
+    if args.lease_check:
+        if report["lease"]["overlapping_windows"]:
+            sys.exit("two replicas held the leader lease at the same time")
+        if report["lease"]["failover_seconds"] is None:
+            sys.exit("no replica took over the leader lease after the holder was killed")
+
+
+if __name__ == "__main__":
+    main()
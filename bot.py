@@ -1,17 +1,25 @@
+import asyncio
+import functools
 import os
+import signal
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
-from pymongo import MongoClient
-from datetime import datetime
-from flask import Flask
-import threading
+from datetime import datetime, timedelta
 
-from keep_alive import keep_alive
-keep_alive()
+from metrics import instrument_handler, track, record_cache, InstrumentedRequest, DUPLICATE_SUBMISSIONS
+from query_profiler import profile_update
+from debounce import Debouncer
+from trending import TrendingTracker, COMMENT_WEIGHT, REPLY_WEIGHT, REACTION_WEIGHT
+from leaderboard import AuraRanks
+from flood_guard import FloodGuard
+from lease import Lease
+from fingerprint import Fingerprint, similarity, NEAR_DUPLICATE_THRESHOLD
 
-
-# Load .env file
+# Load .env file (before reading any settings)
 load_dotenv()
 
 # Environment variables
@@ -21,14 +29,254 @@ CHANNEL_ID = os.getenv("CHANNEL_ID")
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME")
 BOT_USERNAME = os.getenv("BOT_USERNAME")
+# "polling" (one process) or "router": updates are forwarded by router.py to this replica's /telegram
+UPDATE_SOURCE = os.getenv("UPDATE_SOURCE", "polling")
+# Stable name of this replica when several run side by side
+REPLICA_ID = os.getenv("REPLICA_ID")
+
+# MongoDB client and database, created on first use: importing this module opens no sockets
+_client = None
+_db = None
+
+# Connection pool knobs, passed to MongoClient only when set
+POOL_OPTIONS = {
+    option: int(os.environ[env])
+    for env, option in (
+        ("MONGO_MAX_POOL_SIZE", "maxPoolSize"),
+        ("MONGO_MIN_POOL_SIZE", "minPoolSize"),
+        ("MONGO_MAX_CONNECTING", "maxConnecting"),
+        ("MONGO_MAX_IDLE_TIME_MS", "maxIdleTimeMS"),
+        ("MONGO_WAIT_QUEUE_TIMEOUT_MS", "waitQueueTimeoutMS"),
+    )
+    if os.getenv(env)
+}
+
+# Read preference per query class, e.g. MONGO_READ_PREFERENCES="thread=secondary,profile=primary".
+# Classes not listed read from the primary.
+READ_PREFERENCES = {
+    "thread": "secondaryPreferred",
+    "deep_link": "secondaryPreferred",
+    "profile": "secondaryPreferred",
+}
+READ_PREFERENCES.update(
+    item.strip().split("=", 1) for item in os.getenv("MONGO_READ_PREFERENCES", "").split(",") if "=" in item
+)
+# How far behind a secondary may be and still serve reads (-1: no limit, otherwise at least 90)
+MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "-1"))
+
+def get_client():
+    global _client
+    if _client is None:
+        # pymongo is imported here, not at module level, to keep imports fast
+        from pymongo import MongoClient
+        from mongo_listeners import MongoCommandListener, ProfilerListener
+        _client = MongoClient(MONGO_URI, event_listeners=[MongoCommandListener(), ProfilerListener()], **POOL_OPTIONS)
+    return _client
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = get_client()[DB_NAME]
+    return _db
+
+# Run against another database (benchmarks, tests) instead of MONGO_URI/DB_NAME
+def use_database(database):
+    global _db
+    _db = database
+
+def read_preference(query_class):
+    from pymongo import read_preferences
+    modes = {
+        "primaryPreferred": read_preferences.PrimaryPreferred,
+        "secondary": read_preferences.Secondary,
+        "secondaryPreferred": read_preferences.SecondaryPreferred,
+        "nearest": read_preferences.Nearest,
+    }
+    mode = READ_PREFERENCES.get(query_class, "primary")
+    if mode not in modes:
+        return read_preferences.Primary()
+    return modes[mode](max_staleness=MAX_STALENESS_SECONDS)
+
+# Session of the update being handled (see causal_session); collection calls join it
+current_session = ContextVar("mongo_session", default=None)
+SESSION_METHODS = frozenset((
+    "find", "find_one", "find_one_and_update", "insert_one", "insert_many", "update_one",
+    "update_many", "replace_one", "delete_one", "delete_many", "count_documents", "aggregate", "bulk_write",
+))
+
+# Collection handle that resolves against get_db() when first used.
+# With a query class, reads follow READ_PREFERENCES for it instead of the primary.
+class LazyCollection:
+    def __init__(self, name, query_class=None):
+        self.name = name
+        self.query_class = query_class
+        self._db = None
+        self._collection = None
+
+    def __getattr__(self, attr):
+        database = get_db()
+        if database is not self._db:
+            self._db = database
+            self._collection = database[self.name]
+            if self.query_class:
+                self._collection = self._collection.with_options(read_preference=read_preference(self.query_class))
+        value = getattr(self._collection, attr)
+        session = current_session.get()
+        if session is not None and attr in SESSION_METHODS:
+            return functools.partial(value, session=session)
+        return value
+
+_read_handles = {}
+
+# The same collection with reads routed for a query class ("thread", "deep_link", "profile")
+def reads(collection, query_class):
+    if not query_class:
+        return collection
+    key = (collection.name, query_class)
+    if key not in _read_handles:
+        _read_handles[key] = LazyCollection(collection.name, query_class)
+    return _read_handles[key]
+
+# Cluster and operation time seen by each user's last session, so their next
+# secondary read waits until it has replicated what they wrote (read-your-writes)
+causal_tokens = {}
+CAUSAL_TOKENS_MAX = 50_000
+
+# Sessions only matter when reads can land on a secondary
+def causal_reads_enabled():
+    return _client is not None and _client.topology_description.topology_type_name.startswith("ReplicaSet")
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-users_collection = db["users"]
-counters_collection = db["counters"]
-comments_collection = db["comments"]
-channel_posts_collection = db["channel_posts"]
+@contextmanager
+def causal_session(user_ids):
+    if not causal_reads_enabled():
+        yield None
+        return
+    with get_client().start_session(causal_consistency=True) as session:
+        for user_id in user_ids:
+            token = causal_tokens.get(user_id)
+            if token:
+                session.advance_cluster_time(token[0])
+                session.advance_operation_time(token[1])
+        reset = current_session.set(session)
+        try:
+            yield session
+        finally:
+            current_session.reset(reset)
+            if session.cluster_time is not None and session.operation_time is not None:
+                for user_id in user_ids:
+                    causal_tokens.pop(user_id, None)
+                    causal_tokens[user_id] = (session.cluster_time, session.operation_time)
+                while len(causal_tokens) > CAUSAL_TOKENS_MAX:
+                    del causal_tokens[next(iter(causal_tokens))]
+
+# Handler decorator: run the update inside a causal session for its user
+def with_causal_session(func):
+    @functools.wraps(func)
+    async def wrapper(update, context):
+        user = update.effective_user
+        with causal_session([user.id] if user else []):
+            return await func(update, context)
+    return wrapper
+
+users_collection = LazyCollection("users")
+counters_collection = LazyCollection("counters")
+comments_collection = LazyCollection("comments")
+channel_posts_collection = LazyCollection("channel_posts")
+# Approved confessions, denormalised out of users.confessions for browsing and search
+confessions_collection = LazyCollection("confessions")
+# Per-category totals: {_id: category, submitted: n, approved: n}
+category_counts_collection = LazyCollection("category_counts")
+# Periodic snapshot of the in-memory trending scores
+trending_collection = LazyCollection("trending")
+# Admin statistics rollups: {_id: "total" | "day:YYYY-MM-DD" | "stream" | "poll", ...counts}
+stats_collection = LazyCollection("stats")
+# Who was active on which day, only to count each user once per day; expires after a few days
+stats_active_collection = LazyCollection("stats_active")
+STATS_INTERVAL_SECONDS = int(os.getenv("STATS_INTERVAL_SECONDS", "10"))
+# Most source changes folded into the rollups per run
+STATS_BATCH_SIZE = 1000
+STATS_DAYS_SHOWN = 7
+# How long a user's first activity of a day is remembered
+STATS_ACTIVE_DAYS = 3
+# Duplicate detection: {_id: confession_id, user_id, exact, bands, signature, status, submitted_at}, plus
+# moderated_at and the decision it replaced (previous_status, previous_moderated_at) once moderated,
+# and the decision the polling stats consumer last counted (counted_status, counted_at); while polling,
+# stats_pending / stats_moderated mark a submission / decision it hasn't counted yet
+fingerprints_collection = LazyCollection("fingerprints")
+# Most earlier confessions compared against one submission
+DUPLICATE_CANDIDATES = 50
+# Leases for work only one replica may do at a time
+leases_collection = LazyCollection("leases")
+# Cold tier: old confessions with their whole comment thread compressed into one document
+archived_confessions_collection = LazyCollection("archived_confessions")
+
+# Singleton jobs (archiving, one-off migrations) run on whichever replica holds this lease
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "60"))
+leader_lease = Lease(leases_collection, "scheduler", REPLICA_ID, LEADER_LEASE_SECONDS)
+
+# Job decorator: skip the run unless this replica is the leader
+def leader_only(job):
+    @functools.wraps(job)
+    async def wrapper(context):
+        if leader_lease.held:
+            return await job(context)
+    return wrapper
+
+async def renew_leadership(context):
+    await asyncio.to_thread(leader_lease.acquire)
+
+# How often the leader checks for unfinished one-off migrations
+BACKFILL_CHECK_SECONDS = int(os.getenv("BACKFILL_CHECK_SECONDS", "600"))
+
+# Approved confessions older than this move to the archive (0 disables archiving)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(24 * 3600)))
+
+# Engagement-ranked confessions, updated on every comment and reaction
+trending_tracker = TrendingTracker(
+    half_life=float(os.getenv("TRENDING_HALF_LIFE_HOURS", "6")) * 3600,
+    size=int(os.getenv("TRENDING_SIZE", "20"))
+)
+TRENDING_SNAPSHOT_SECONDS = int(os.getenv("TRENDING_SNAPSHOT_SECONDS", "300"))
+
+# Users per aura value, kept in step with this replica's update_user_aura; resynced from the DB periodically
+aura_ranks = AuraRanks()
+LEADERBOARD_SIZE = 100
+LEADERBOARD_SHOWN = 10
+LEADERBOARD_RESYNC_SECONDS = int(os.getenv("LEADERBOARD_RESYNC_SECONDS", "3600"))
+
+# Categories offered when submitting; shown as #hashtags without spaces
+CONFESSION_CATEGORIES = ["family","sexual assult","addition","friendship","relation ship","couples","truama","mental",
+                         "sexual","crush","rape","harassment","school","collage","university","highschool","others"]
+CATEGORY_BY_HASHTAG = {f"#{cat.replace(' ', '')}": cat for cat in CONFESSION_CATEGORIES}
+
+BROWSE_PAGE_SIZE = 5
+SEARCH_MAX_RESULTS = 50
+
+# Create the indexes and counter documents the queries below rely on (idempotent)
+def ensure_indexes():
+    confessions_collection.create_index("confession_id", unique=True)
+    confessions_collection.create_index([("categories", 1), ("confession_id", -1)])
+    confessions_collection.create_index([("text", "text")], default_language="none")
+    users_collection.create_index("telegram_id")
+    users_collection.create_index("confessions.confession_id")
+    users_collection.create_index("confessions.categories")
+    users_collection.create_index([("confessions.status", 1), ("confessions.timestamp", 1)])
+    comments_collection.create_index("comment_id")
+    comments_collection.create_index([("confession_id", 1), ("timestamp", 1)])
+    channel_posts_collection.create_index("confession_id")
+    users_collection.create_index([("aura", -1)])
+    fingerprints_collection.create_index("exact")
+    fingerprints_collection.create_index("bands")
+    fingerprints_collection.create_index("moderated_at", sparse=True)
+    fingerprints_collection.create_index("stats_pending", sparse=True)
+    fingerprints_collection.create_index("stats_moderated", sparse=True)
+    comments_collection.create_index("stats_pending", sparse=True)
+    users_collection.create_index("stats_pending", sparse=True)
+    stats_active_collection.create_index("at", expireAfterSeconds=STATS_ACTIVE_DAYS * 24 * 3600)
+    archived_confessions_collection.create_index([("owner_id", 1), ("_id", 1)])
+    ensure_category_counters()
 
 # Helper: get or create user in DB
 def get_or_create_user(user_id):
@@ -42,11 +290,18 @@ def get_or_create_user(user_id):
             "confessions": [],
             "comments": [],
             "liked_comments": [],
-            "disliked_comments": []
+            "disliked_comments": [],
+            **stats_pending()
         }
         users_collection.insert_one(user)
+        aura_ranks.add(0)
     return user
 
+# Read a user for display, routed by query class; unknown users are created on the primary
+def get_user(user_id, query_class=None):
+    user = reads(users_collection, query_class).find_one({"telegram_id": user_id})
+    return user or get_or_create_user(user_id)
+
 # Update user data in DB
 def update_user(user_id, data: dict):
     users_collection.update_one({"telegram_id": user_id}, {"$set": data})
@@ -57,7 +312,32 @@ def update_user_aura(user_id, delta):
         {"telegram_id": user_id},
         {"$inc": {"aura": delta}}
     )
-    return users_collection.find_one({"telegram_id": user_id})["aura"]
+    new_aura = users_collection.find_one({"telegram_id": user_id})["aura"]
+    aura_ranks.move(new_aura - delta, new_aura)
+    return new_aura
+
+# Count users per aura value from the users collection (a full $group over users)
+def build_aura_ranks():
+    ranks = AuraRanks()
+    ranks.load(users_collection.aggregate([{"$group": {"_id": "$aura", "count": {"$sum": 1}}}]))
+    return ranks
+
+def load_aura_ranks():
+    global aura_ranks
+    aura_ranks = build_aura_ranks()
+
+# Aura changes made on other replicas only reach these counts here, so ranks can lag
+# by up to LEADERBOARD_RESYNC_SECONDS. The recount runs off the event loop and the
+# new counts replace the old ones in one assignment.
+async def resync_aura_ranks(context):
+    global aura_ranks
+    aura_ranks = await asyncio.to_thread(build_aura_ranks)
+
+# Highest-aura users, straight off the aura index
+def get_top_users(limit=LEADERBOARD_SIZE):
+    return list(reads(users_collection, "profile").find(
+        {}, {"_id": 0, "telegram_id": 1, "nickname": 1, "profile_emoji": 1, "aura": 1}
+    ).sort("aura", -1).limit(limit))
 
 # Generate global incremental confession ID
 def get_next_confession_id():
@@ -79,21 +359,598 @@ def get_next_comment_id():
     )
     return counter["seq"]
 
-# Get confession from DB by ID
-def get_confession_by_id(confession_id):
-    user = users_collection.find_one({"confessions.confession_id": confession_id})
+# Get confession from DB by ID (falls back to the archive for old confessions)
+def get_confession_by_id(confession_id, query_class=None):
+    user = reads(users_collection, query_class).find_one({"confessions.confession_id": confession_id})
     if user:
         for confession in user["confessions"]:
             if confession["confession_id"] == confession_id:
                 return confession
+    # Rejected after archiving: hidden, like a confession that was never approved
+    archived = reads(archived_confessions_collection, query_class).find_one(
+        {"_id": confession_id, "confession.status": {"$ne": "rejected"}}, {"confession": 1, "comment_count": 1}
+    )
+    if archived:
+        return {**archived["confession"], "archived": True, "comment_count": archived["comment_count"]}
     return None
 
+# A user's archived confessions (moved out of their user document), oldest first
+def get_archived_confessions(owner_id, query_class=None):
+    archived = reads(archived_confessions_collection, query_class).find(
+        {"owner_id": owner_id}, {"_id": 0, "confession.confession_id": 1, "confession.text": 1, "confession.status": 1}
+    ).sort("_id", 1)
+    return [{**doc["confession"], "archived": True} for doc in archived]
+
+# Comment count shown on a confession; archived ones carry theirs
+def get_comment_count(confession, query_class=None):
+    if confession.get("archived"):
+        return confession.get("comment_count", 0)
+    return reads(comments_collection, query_class).count_documents({"confession_id": confession["confession_id"]})
+
+# Comment threads are stored in the archive as zlib-compressed BSON
+def pack_comments(comments):
+    import bson
+    return bson.Binary(zlib.compress(bson.encode({"comments": comments}), 9))
+
+def unpack_comments(payload):
+    import bson
+    return bson.decode(zlib.decompress(bytes(payload)))["comments"]
+
+# Move one confession and its comments to the archive. The archive copy is written
+# before anything is removed, so an interrupted run only leaves a duplicate behind.
+def archive_confession(owner_id, confession):
+    confession_id = confession["confession_id"]
+    comments = list(comments_collection.find({"confession_id": confession_id}, {"_id": 0}).sort("timestamp", 1))
+    archived_confessions_collection.replace_one(
+        {"_id": confession_id},
+        {
+            "_id": confession_id,
+            "owner_id": owner_id,
+            "confession": {k: v for k, v in confession.items() if k != "comments"},
+            "comment_count": len(comments),
+            "comments": pack_comments(comments),
+            "archived_at": datetime.now()
+        },
+        upsert=True
+    )
+    # Only the comments that were archived; any that raced in stay hot and are merged on read
+    comments_collection.delete_many({"comment_id": {"$in": [c["comment_id"] for c in comments]}})
+    users_collection.update_one(
+        {"telegram_id": owner_id},
+        {"$pull": {"confessions": {"confession_id": confession_id}}}
+    )
+
+# Archive a batch of approved confessions older than ARCHIVE_AFTER_DAYS
+def archive_old_confessions(limit=ARCHIVE_BATCH_SIZE):
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    old = {"status": "approved", "timestamp": {"$lt": cutoff}}
+    candidates = users_collection.aggregate([
+        {"$match": {"confessions": {"$elemMatch": old}}},
+        {"$unwind": "$confessions"},
+        {"$match": {f"confessions.{field}": value for field, value in old.items()}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "telegram_id": 1, "confession": "$confessions"}}
+    ])
+    count = 0
+    for candidate in candidates:
+        archive_confession(candidate["telegram_id"], candidate["confession"])
+        count += 1
+    return count
+
+@leader_only
+async def archive_job(context):
+    count = await asyncio.to_thread(archive_old_confessions)
+    if count:
+        print(f"Archived {count} confessions")
+
+# Categories named by the #hashtags in a confession's text (confessions from before categories were stored)
+def parse_categories(text):
+    return [CATEGORY_BY_HASHTAG[word] for word in text.split() if word in CATEGORY_BY_HASHTAG]
+
+# Confession text with its categories rendered as hashtags, as posted to admins and the channel
+def confession_display_text(confession):
+    categories = confession.get("categories")
+    if not categories:
+        return confession.get("text", "")
+    hashtags = ' '.join([f"#{cat.replace(' ', '')}" for cat in categories])
+    return f"{confession.get('text', '')}\n\n{hashtags}"
+
+# Bump the per-category counters for one confession
+def count_categories(categories, field, amount=1):
+    if categories:
+        category_counts_collection.update_many({"_id": {"$in": list(categories)}}, {"$inc": {field: amount}})
+
+# Make sure every category has a counter document, so count_categories needs no upserts
+def ensure_category_counters():
+    for category in CONFESSION_CATEGORIES:
+        category_counts_collection.update_one(
+            {"_id": category},
+            {"$setOnInsert": {"submitted": 0, "approved": 0, "comments": 0}},
+            upsert=True
+        )
+
+# Per-category totals, keyed by category
+def get_category_counts():
+    return {doc["_id"]: doc for doc in category_counts_collection.find()}
+
+# Copy an approved confession into the browse/search collection
+def index_approved_confession(confession):
+    confessions_collection.update_one(
+        {"confession_id": confession["confession_id"]},
+        {"$set": {
+            "text": confession["text"],
+            "categories": confession.get("categories", []),
+            "timestamp": confession.get("timestamp"),
+        }},
+        upsert=True
+    )
+
+# One-off migration: move hashtags out of legacy confession text into the categories field,
+# then recount the category counters from scratch
+def backfill_confession_categories():
+    for user in users_collection.find({"confessions": {"$elemMatch": {"categories": {"$exists": False}}}}):
+        for confession in user["confessions"]:
+            if "categories" in confession:
+                continue
+            categories = parse_categories(confession["text"])
+            text = confession["text"]
+            # Drop the hashtag line final_submit used to append
+            body, _, last_line = text.rpartition("\n\n")
+            if body and categories and all(word in CATEGORY_BY_HASHTAG for word in last_line.split()):
+                text = body
+            # Only this element changes: confessions pushed meanwhile (other replicas keep serving) stay
+            users_collection.update_one(
+                {"_id": user["_id"], "confessions": {"$elemMatch": {
+                    "confession_id": confession["confession_id"], "categories": {"$exists": False}
+                }}},
+                {"$set": {"confessions.$.categories": categories, "confessions.$.text": text}}
+            )
+    
+    totals = {category: {"submitted": 0, "approved": 0} for category in CONFESSION_CATEGORIES}
+    for row in users_collection.aggregate([
+        {"$unwind": "$confessions"},
+        {"$unwind": "$confessions.categories"},
+        {"$group": {
+            "_id": "$confessions.categories",
+            "submitted": {"$sum": 1},
+            "approved": {"$sum": {"$cond": [{"$eq": ["$confessions.status", "approved"]}, 1, 0]}}
+        }}
+    ]):
+        totals[row["_id"]] = {"submitted": row["submitted"], "approved": row["approved"]}
+    # The comment counters belong to the stats consumer
+    ensure_category_counters()
+    for category, counts in totals.items():
+        category_counts_collection.update_one({"_id": category}, {"$set": counts}, upsert=True)
+    # Refresh the browse copies so they carry the cleaned text
+    backfill_confession_index()
+    counters_collection.update_one({"_id": "categories_backfilled"}, {"$set": {"at": datetime.now()}}, upsert=True)
+
+# Remember a submitted confession's fingerprint for later duplicate checks
+def store_fingerprint(confession_id, user_id, fingerprint, status="pending", submitted_at=None):
+    fingerprints_collection.replace_one(
+        {"_id": confession_id},
+        {
+            "_id": confession_id,
+            "user_id": user_id,
+            "exact": fingerprint.exact,
+            "bands": fingerprint.bands,
+            "signature": fingerprint.signature,
+            "status": status,
+            "submitted_at": submitted_at or datetime.now(),
+            **stats_pending()
+        },
+        upsert=True
+    )
+
+# Earlier confessions this fingerprint duplicates, most similar first.
+# Exact copies are probed first so a crowd of band collisions can't push them past
+# the candidate limit; both probes use an index (exact hash, LSH band keys).
+def find_duplicates(fingerprint):
+    candidates = list(fingerprints_collection.find({"exact": fingerprint.exact}, {"bands": 0}).limit(DUPLICATE_CANDIDATES))
+    if len(candidates) < DUPLICATE_CANDIDATES:
+        candidates += fingerprints_collection.find(
+            {"bands": {"$in": fingerprint.bands}, "_id": {"$nin": [c["_id"] for c in candidates]}},
+            {"bands": 0}
+        ).limit(DUPLICATE_CANDIDATES - len(candidates))
+    matches = []
+    for candidate in candidates:
+        if candidate["exact"] == fingerprint.exact:
+            score = 1.0
+        else:
+            score = similarity(fingerprint.signature, candidate["signature"])
+        if score >= NEAR_DUPLICATE_THRESHOLD:
+            matches.append({**candidate, "similarity": score})
+    return sorted(matches, key=lambda match: match["similarity"], reverse=True)
+
+# One-off: fingerprint confessions submitted before duplicate detection existed
+def backfill_fingerprints():
+    for user in users_collection.find({"confessions.0": {"$exists": True}}, {"telegram_id": 1, "confessions": 1}):
+        for confession in user["confessions"]:
+            store_fingerprint(
+                confession["confession_id"], user["telegram_id"],
+                Fingerprint(confession.get("text", "")), confession.get("status", "pending"),
+                confession.get("timestamp")
+            )
+    counters_collection.update_one({"_id": "fingerprints_backfilled"}, {"$set": {"at": datetime.now()}}, upsert=True)
+
+# One-off fill of the browse collection from confessions approved before it existed
+def backfill_confession_index():
+    approved = users_collection.aggregate([
+        {"$match": {"confessions.status": "approved"}},
+        {"$unwind": "$confessions"},
+        {"$match": {"confessions.status": "approved"}},
+        {"$replaceRoot": {"newRoot": "$confessions"}}
+    ])
+    count = 0
+    for confession in approved:
+        index_approved_confession(confession)
+        count += 1
+    return count
+
+def stats_day(value):
+    return value.strftime("%Y-%m-%d")
+
+# Increments for one run of the stats consumer, applied together
+class StatsBatch:
+    def __init__(self):
+        self.rollups = {}
+        self.categories = {}
+        self.active = set()
+        # Polling only: the decision now counted per confession, written back to its fingerprint
+        self.counted = {}
+
+    # A day of None only moves the total (decisions made before moderation times were recorded)
+    def add(self, day, field, amount=1):
+        for key in ("total", f"day:{day}" if day else None):
+            if key:
+                fields = self.rollups.setdefault(key, {})
+                fields[field] = fields.get(field, 0) + amount
+
+    # A changed decision moves the count from the old status to the new one
+    def decision(self, status, at, previous=None, previous_at=None):
+        if status in ("approved", "rejected"):
+            self.add(stats_day(at or datetime.now()), status)
+        if previous in ("approved", "rejected"):
+            self.add(stats_day(previous_at) if previous_at else None, previous, -1)
+
+    def comment(self, day, user_id, categories, is_reply):
+        self.add(day, "comments")
+        if is_reply:
+            self.add(day, "replies")
+        for category in categories:
+            self.categories[category] = self.categories.get(category, 0) + 1
+        self.active.add((day, user_id))
+
+    def __len__(self):
+        return len(self.rollups) + len(self.categories) + len(self.active) + len(self.counted)
+
+# Categories of the confessions being commented on, one query per batch
+def stats_categories(confession_ids):
+    if not confession_ids:
+        return {}
+    return {
+        doc["confession_id"]: doc.get("categories", [])
+        for doc in confessions_collection.find(
+            {"confession_id": {"$in": list(confession_ids)}}, {"_id": 0, "confession_id": 1, "categories": 1}
+        )
+    }
+
+# Fold source documents into a batch: new confessions (fingerprints), moderation
+# decisions (fingerprint status updates, with the decision each one replaced), comments and new users
+def add_stats_changes(batch, submitted=(), moderated=(), comments=(), users=()):
+    for doc in submitted:
+        day = stats_day(doc.get("submitted_at") or datetime.now())
+        batch.add(day, "submitted")
+        batch.active.add((day, doc["user_id"]))
+    for doc in moderated:
+        batch.decision(doc.get("status"), doc.get("moderated_at"), doc.get("previous_status"), doc.get("previous_moderated_at"))
+    comments = list(comments)
+    categories = stats_categories({comment["confession_id"] for comment in comments})
+    for comment in comments:
+        batch.comment(
+            stats_day(comment.get("timestamp") or datetime.now()), comment["user_id"],
+            categories.get(comment["confession_id"], []), comment.get("is_reply", False)
+        )
+    for user in users:
+        batch.add(stats_day(user["_id"].generation_time.astimezone().replace(tzinfo=None)), "new_users")
+
+# Write a batch and the consumer position; safe to retry inside a transaction (nothing is mutated)
+def apply_stats_batch(batch, state_id, state, session=None):
+    now = datetime.now()
+    rollups = {key: dict(fields) for key, fields in batch.rollups.items()}
+    for day, user_id in batch.active:
+        first_today = stats_active_collection.update_one(
+            {"_id": f"{day}:{user_id}"}, {"$setOnInsert": {"at": now}}, upsert=True, session=session
+        )
+        if first_today.upserted_id is not None:
+            fields = rollups.setdefault(f"day:{day}", {})
+            fields["active_users"] = fields.get("active_users", 0) + 1
+    for key, fields in rollups.items():
+        stats_collection.update_one({"_id": key}, {"$inc": fields}, upsert=True, session=session)
+    for category, count in batch.categories.items():
+        category_counts_collection.update_one({"_id": category}, {"$inc": {"comments": count}}, upsert=True, session=session)
+    for confession_id, (status, moderated_at) in batch.counted.items():
+        fingerprints_collection.update_one(
+            {"_id": confession_id}, {"$set": {"counted_status": status, "counted_at": moderated_at}}, session=session
+        )
+    stats_collection.update_one({"_id": state_id}, {"$set": {**state, "updated_at": now}}, upsert=True, session=session)
+
+# Full recount, only when there is no consumer position yet (first start, lost change stream history).
+# For polling, flagged documents are left to the poll, and decisions are recounted as last counted.
+def rebuild_stats(pending=False):
+    fresh = {"stats_pending": {"$ne": True}} if pending else {}
+    status_field, at_field = ("counted_status", "counted_at") if pending else ("status", "moderated_at")
+
+    def by_day(collection, date_field, match=None, group=None):
+        pipeline = [{"$match": {date_field: {"$type": "date"}, **(match or {})}}]
+        pipeline.append({"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}},
+            "count": {"$sum": 1},
+            **(group or {})
+        }})
+        return collection.aggregate(pipeline)
+
+    rollups = {"total": {"submitted": 0, "approved": 0, "rejected": 0, "comments": 0, "replies": 0, "new_users": 0}}
+    def put(day, field, amount):
+        rollups["total"][field] += amount
+        if day:
+            fields = rollups.setdefault(f"day:{day}", {})
+            fields[field] = fields.get(field, 0) + amount
+
+    for row in by_day(fingerprints_collection, "submitted_at", fresh):
+        put(row["_id"], "submitted", row["count"])
+    for status in ("approved", "rejected"):
+        for row in by_day(fingerprints_collection, at_field, {status_field: status}):
+            put(row["_id"], status, row["count"])
+        # Decided before moderation times were recorded: totals only
+        put(None, status, fingerprints_collection.count_documents({status_field: status, at_field: {"$exists": False}}))
+    replies = {"replies": {"$sum": {"$cond": [{"$eq": ["$is_reply", True]}, 1, 0]}}}
+    for row in by_day(comments_collection, "timestamp", fresh, replies):
+        put(row["_id"], "comments", row["count"])
+        put(row["_id"], "replies", row["replies"])
+    for row in archived_confessions_collection.aggregate([{"$group": {"_id": None, "count": {"$sum": "$comment_count"}}}]):
+        put(None, "comments", row["count"])
+    new_users = {}
+    for user in users_collection.find(fresh, {"_id": 1}):
+        day = stats_day(user["_id"].generation_time.astimezone().replace(tzinfo=None))
+        new_users[day] = new_users.get(day, 0) + 1
+    for day, count in new_users.items():
+        put(day, "new_users", count)
+
+    # Active users: who submitted or commented on each day (comments of archived confessions are gone)
+    active = set()
+    for collection, date_field in ((fingerprints_collection, "submitted_at"), (comments_collection, "timestamp")):
+        for row in collection.aggregate([
+            {"$match": {date_field: {"$type": "date"}, **fresh}},
+            {"$group": {"_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}}, "user_id": "$user_id"
+            }}}
+        ]):
+            active.add((row["_id"]["day"], row["_id"]["user_id"]))
+    for day, user_id in active:
+        fields = rollups.setdefault(f"day:{day}", {})
+        fields["active_users"] = fields.get("active_users", 0) + 1
+
+    per_confession = {
+        row["_id"]: row["count"]
+        for row in comments_collection.aggregate([{"$match": fresh}, {"$group": {"_id": "$confession_id", "count": {"$sum": 1}}}])
+    }
+    category_comments = {category: 0 for category in CONFESSION_CATEGORIES}
+    for confession_id, categories in stats_categories(per_confession).items():
+        for category in categories:
+            category_comments[category] = category_comments.get(category, 0) + per_confession[confession_id]
+
+    stats_collection.delete_many({"_id": {"$regex": "^(total|day:)"}})
+    stats_collection.insert_many([{"_id": key, **fields} for key, fields in rollups.items()])
+    for category, count in category_comments.items():
+        category_counts_collection.update_one({"_id": category}, {"$set": {"comments": count}}, upsert=True)
+    # The markers must agree with the recounted days, or users already counted today would be counted again
+    now = datetime.now()
+    recent = stats_day(now - timedelta(days=STATS_ACTIVE_DAYS - 1))
+    stats_active_collection.delete_many({})
+    markers = [{"_id": f"{day}:{user_id}", "at": now} for day, user_id in active if day >= recent]
+    if markers:
+        stats_active_collection.insert_many(markers)
+
+# Change streams need a replica set (or sharded cluster); standalone mongod falls back to polling
+def change_streams_available():
+    return _client is not None and _client.topology_description.topology_type_name in (
+        "ReplicaSetWithPrimary", "Sharded"
+    )
+
+STATS_WATCHED = ["fingerprints", "comments", "users"]
+
+# The resume token is older than the oplog, or the stream can't be resumed: start over
+CHANGE_STREAM_LOST_CODES = (286, 280)  # ChangeStreamHistoryLost, ChangeStreamFatalError
+
+# Consume up to `limit` changes from the change stream and fold them into the rollups.
+# The rollup increments and the new resume token are written in one transaction.
+def consume_stats_stream(limit=STATS_BATCH_SIZE):
+    from pymongo.errors import OperationFailure
+    try:
+        return _consume_stats_stream(limit)
+    except OperationFailure as e:
+        if e.code not in CHANGE_STREAM_LOST_CODES:
+            raise
+        print(f"Stats change stream lost its position ({e.code}), recounting")
+        # No resume token means the next read repositions the stream and rebuilds the rollups
+        stats_collection.delete_one({"_id": "stream"})
+        return _consume_stats_stream(limit)
+
+def _consume_stats_stream(limit):
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": STATS_WATCHED},
+        "$or": [
+            {"operationType": "insert"},
+            {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}}
+        ]
+    }}]
+    state = stats_collection.find_one({"_id": "stream"})
+    resume_token = state.get("resume_token") if state else None
+    changes = {"fingerprints": [], "moderated": [], "comments": [], "users": []}
+    with get_db().watch(pipeline, resume_after=resume_token, max_await_time_ms=100) as stream:
+        if resume_token is None:
+            # Position the stream first so nothing between the recount and now is missed
+            resume_token = stream.resume_token
+            rebuild_stats()
+        else:
+            while sum(len(docs) for docs in changes.values()) < limit:
+                change = stream.try_next()
+                if change is None:
+                    break
+                collection = change["ns"]["coll"]
+                if change["operationType"] == "insert":
+                    changes[collection].append(change["fullDocument"])
+                elif collection == "fingerprints":
+                    changes["moderated"].append(change["updateDescription"]["updatedFields"])
+            resume_token = stream.resume_token
+
+    batch = StatsBatch()
+    add_stats_changes(
+        batch, submitted=changes["fingerprints"], moderated=changes["moderated"],
+        comments=changes["comments"], users=changes["users"]
+    )
+    with get_client().start_session() as session:
+        session.with_transaction(lambda s: apply_stats_batch(batch, "stream", {"resume_token": resume_token}, s))
+    return len(batch)
+
+# Polling only: new documents and decisions carry a flag until the consumer has counted them,
+# so neither ids committed out of order nor another replica's clock can hide them
+def stats_pending(flag="stats_pending"):
+    return {} if change_streams_available() else {flag: True}
+
+# Standalone fallback: count the flagged documents, then clear their flags
+def poll_stats(limit=STATS_BATCH_SIZE):
+    if not stats_collection.find_one({"_id": "poll"}):
+        # The recount holds every unflagged decision; flagged ones are moved from there by later polls
+        fingerprints_collection.update_many(
+            {"status": {"$in": ["approved", "rejected"]}, "stats_moderated": {"$ne": True}},
+            [{"$set": {"counted_status": "$status", "counted_at": "$moderated_at"}}]
+        )
+        rebuild_stats(pending=True)
+        apply_stats_batch(StatsBatch(), "poll", {})
+        return 0
+
+    submitted = list(fingerprints_collection.find({"stats_pending": True}, {"user_id": 1, "submitted_at": 1}).limit(limit))
+    moderated = list(fingerprints_collection.find(
+        {"stats_moderated": True}, {"status": 1, "moderated_at": 1, "counted_status": 1, "counted_at": 1}
+    ).limit(limit))
+    comments = list(comments_collection.find(
+        {"stats_pending": True}, {"confession_id": 1, "user_id": 1, "is_reply": 1, "timestamp": 1}
+    ).limit(limit))
+    users = list(users_collection.find({"stats_pending": True}, {"_id": 1}).limit(limit))
+
+    batch = StatsBatch()
+    # A poll only sees the latest decision, and a confession can change several times between
+    # runs; what it replaces in the rollups is the decision this consumer last counted
+    # (and nothing, if that is already this one)
+    changed = [
+        doc for doc in moderated
+        if (doc.get("counted_status"), doc.get("counted_at")) != (doc.get("status"), doc.get("moderated_at"))
+    ]
+    add_stats_changes(batch, submitted, [
+        {**doc, "previous_status": doc.get("counted_status"), "previous_moderated_at": doc.get("counted_at")}
+        for doc in changed
+    ], comments, users)
+    batch.counted = {doc["_id"]: (doc["status"], doc["moderated_at"]) for doc in changed}
+    apply_stats_batch(batch, "poll", {})
+
+    for collection, docs in ((fingerprints_collection, submitted), (comments_collection, comments), (users_collection, users)):
+        if docs:
+            collection.update_many({"_id": {"$in": [doc["_id"] for doc in docs]}}, {"$unset": {"stats_pending": ""}})
+    # A decision changed since it was read keeps its flag for the next run
+    for doc in moderated:
+        fingerprints_collection.update_one(
+            {"_id": doc["_id"], "status": doc.get("status"), "moderated_at": doc.get("moderated_at")},
+            {"$unset": {"stats_moderated": ""}}
+        )
+    return len(batch)
+
+def update_stats():
+    if change_streams_available():
+        return consume_stats_stream()
+    return poll_stats()
+
+@leader_only
+async def stats_job(context):
+    await asyncio.to_thread(update_stats)
+
+# /stats text: a handful of small documents, never the source collections
+def stats_page():
+    days = [stats_day(datetime.now() - timedelta(days=n)) for n in range(STATS_DAYS_SHOWN)]
+    docs = {doc["_id"]: doc for doc in stats_collection.find({"_id": {"$in": ["total", "stream", "poll"] + [f"day:{day}" for day in days]}})}
+    total = docs.get("total")
+    if not total:
+        return "📊 Statistics are still being computed, try again in a minute."
+    approved, rejected = total.get("approved", 0), total.get("rejected", 0)
+    approval_rate = f"{approved / (approved + rejected):.0%}" if approved + rejected else "n/a"
+    lines = [
+        "📊 Confession Bot Stats",
+        "",
+        f"Confessions: {total.get('submitted', 0)} submitted, {approved} approved, {rejected} rejected",
+        f"Approval rate: {approval_rate}",
+        f"Comments: {total.get('comments', 0)} ({total.get('replies', 0)} replies)",
+        f"Users: {total.get('new_users', 0)}",
+        "",
+        f"Last {STATS_DAYS_SHOWN} days (confessions / approved / comments / active users):",
+    ]
+    for day in days:
+        doc = docs.get(f"day:{day}", {})
+        lines.append(
+            f"{day}: {doc.get('submitted', 0)} / {doc.get('approved', 0)} / {doc.get('comments', 0)} / {doc.get('active_users', 0)}"
+        )
+    category_comments = sorted(
+        ((doc.get("comments", 0), category) for category, doc in get_category_counts().items()), reverse=True
+    )
+    lines += ["", "Comments per category:"]
+    lines += [f"#{category.replace(' ', '')}: {count}" for count, category in category_comments if count]
+    state = docs.get("stream") or docs.get("poll")
+    if state:
+        lines += ["", f"Updated {state['updated_at']:%H:%M:%S}"]
+    return "\n".join(lines)
+
+# Page of approved confessions, newest first; before_id is the cursor from the previous page
+def browse_confessions(category=None, before_id=None, limit=BROWSE_PAGE_SIZE):
+    query = {}
+    if category:
+        query["categories"] = category
+    if before_id:
+        query["confession_id"] = {"$lt": before_id}
+    results = list(confessions_collection.find(
+        query, {"_id": 0, "confession_id": 1, "text": 1}
+    ).sort("confession_id", -1).limit(limit + 1))
+    # One extra row tells us whether there is a next page
+    return results[:limit], len(results) > limit
+
+# Ids of the best matches for a search, most relevant first. Ranking by text score under a
+# limit is a bounded top-k sort; the result pages are then read back by id from this list.
+def search_confessions(search, limit=SEARCH_MAX_RESULTS):
+    score = {"$meta": "textScore"}
+    results = confessions_collection.find(
+        {"$text": {"$search": search}}, {"_id": 0, "confession_id": 1, "score": score}
+    ).sort([("score", score)]).limit(limit)
+    return [conf["confession_id"] for conf in results]
+
+# One page of search results, in the order search_confessions ranked them
+def search_results_page(result_ids, offset, limit=BROWSE_PAGE_SIZE):
+    page_ids = result_ids[offset:offset + limit]
+    if not page_ids:
+        return [], False
+    found = {
+        conf["confession_id"]: conf
+        for conf in confessions_collection.find({"confession_id": {"$in": page_ids}}, {"_id": 0, "confession_id": 1, "text": 1})
+    }
+    return [found[i] for i in page_ids if i in found], len(result_ids) > offset + limit
+
 # Add confession to DB
-def add_confession(user_id, text, status="pending"):
+def add_confession(user_id, text, status="pending", categories=None):
     confession_id = get_next_confession_id()
     confession = {
         "confession_id": confession_id,
         "text": text,
+        "categories": list(categories or []),
         "status": status,
         "user_id": user_id,
         "timestamp": datetime.now(),
@@ -103,6 +960,9 @@ def add_confession(user_id, text, status="pending"):
         {"telegram_id": user_id},
         {"$push": {"confessions": confession}}
     )
+    count_categories(confession["categories"], "submitted")
+    if status == "approved":
+        count_categories(confession["categories"], "approved")
     return confession_id
 
 # Add comment to confession
@@ -120,7 +980,7 @@ def add_comment_to_confession(confession_id, user_id, text):
     }
     
     # Add to comments collection
-    comments_collection.insert_one(comment)
+    comments_collection.insert_one({**comment, **stats_pending()})
     
     # Also add to user's comments
     users_collection.update_one(
@@ -128,6 +988,7 @@ def add_comment_to_confession(confession_id, user_id, text):
         {"$push": {"comments": comment}}
     )
     
+    trending_tracker.record(confession_id, COMMENT_WEIGHT)
     return comment_id
 
 # Add reply to comment
@@ -155,7 +1016,7 @@ def add_reply_to_comment(parent_comment_id, user_id, text):
     }
     
     # Add to comments collection
-    comments_collection.insert_one(reply)
+    comments_collection.insert_one({**reply, **stats_pending()})
     
     # Also add to user's comments
     users_collection.update_one(
@@ -169,128 +1030,79 @@ def add_reply_to_comment(parent_comment_id, user_id, text):
         {"$inc": {"reply_count": 1}}
     )
     
+    trending_tracker.record(confession_id, REPLY_WEIGHT)
     return reply_id, confession_id
 
-# Handle like/dislike on comment
-def handle_comment_reaction(comment_id, user_id, reaction_type):
+# Reaction state a tap moves to: tapping the active reaction clears it
+def next_reaction_state(state, reaction_type):
+    tapped = "liked" if reaction_type == "like" else "disliked"
+    return None if state == tapped else tapped
+
+# Aura a reaction gives the comment owner
+REACTION_AURA = {"liked": 1, "disliked": -1, None: 0}
+
+# Apply one or more taps on a comment as a single net change; also returns the comment read
+def apply_comment_reactions(comment_id, user_id, reaction_types):
     comment = comments_collection.find_one({"comment_id": comment_id})
     if not comment:
-        return None, 0, 0
+        return None, 0, 0, None
     
     comment_owner_id = comment["user_id"]
     user = get_or_create_user(user_id)
     
-    # Check if user already liked/disliked
-    liked_comments = user.get("liked_comments", [])
-    disliked_comments = user.get("disliked_comments", [])
+    # Where the user stands now, and where the taps leave them
+    if comment_id in user.get("liked_comments", []):
+        initial = "liked"
+    elif comment_id in user.get("disliked_comments", []):
+        initial = "disliked"
+    else:
+        initial = None
+    final = initial
+    for reaction_type in reaction_types:
+        final = next_reaction_state(final, reaction_type)
     
     likes = comment.get("likes", 0)
     dislikes = comment.get("dislikes", 0)
-    aura_change = 0
-    
-    if reaction_type == "like":
-        if comment_id in liked_comments:
-            # User already liked, remove like
-            likes -= 1
-            comments_collection.update_one(
-                {"comment_id": comment_id},
-                {"$inc": {"likes": -1}}
-            )
-            users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$pull": {"liked_comments": comment_id}}
-            )
-            # Decrease aura from comment owner
-            new_aura = update_user_aura(comment_owner_id, -1)
-            aura_change = -1
-            result = "like_removed"
-        else:
-            # Add like
-            likes += 1
-            comments_collection.update_one(
-                {"comment_id": comment_id},
-                {"$inc": {"likes": 1}}
-            )
-            users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$push": {"liked_comments": comment_id}}
-            )
-            # Increase aura for comment owner
-            new_aura = update_user_aura(comment_owner_id, 1)
-            aura_change = 1
-            result = "liked"
-            
-            # If user previously disliked, remove dislike
-            if comment_id in disliked_comments:
-                dislikes -= 1
-                comments_collection.update_one(
-                    {"comment_id": comment_id},
-                    {"$inc": {"dislikes": -1}}
-                )
-                users_collection.update_one(
-                    {"telegram_id": user_id},
-                    {"$pull": {"disliked_comments": comment_id}}
-                )
-                # Add back aura that was decreased
-                update_user_aura(comment_owner_id, 1)
-                aura_change += 1
-    
-    elif reaction_type == "dislike":
-        if comment_id in disliked_comments:
-            # User already disliked, remove dislike
-            dislikes -= 1
-            comments_collection.update_one(
-                {"comment_id": comment_id},
-                {"$inc": {"dislikes": -1}}
-            )
-            users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$pull": {"disliked_comments": comment_id}}
-            )
-            # Add back aura that was decreased
-            new_aura = update_user_aura(comment_owner_id, 1)
-            aura_change = 1
-            result = "dislike_removed"
-        else:
-            # Add dislike
-            dislikes += 1
-            comments_collection.update_one(
-                {"comment_id": comment_id},
-                {"$inc": {"dislikes": 1}}
-            )
-            users_collection.update_one(
-                {"telegram_id": user_id},
-                {"$push": {"disliked_comments": comment_id}}
-            )
-            # Decrease aura for comment owner
-            new_aura = update_user_aura(comment_owner_id, -1)
-            aura_change = -1
-            result = "disliked"
-            
-            # If user previously liked, remove like
-            if comment_id in liked_comments:
-                likes -= 1
-                comments_collection.update_one(
-                    {"comment_id": comment_id},
-                    {"$inc": {"likes": -1}}
-                )
-                users_collection.update_one(
-                    {"telegram_id": user_id},
-                    {"$pull": {"liked_comments": comment_id}}
-                )
-                # Remove aura that was added
-                update_user_aura(comment_owner_id, -1)
-                aura_change -= 1
+    if final == initial:
+        return "unchanged", likes, dislikes, comment
     
-    return result, likes, dislikes
+    like_delta = (final == "liked") - (initial == "liked")
+    dislike_delta = (final == "disliked") - (initial == "disliked")
+    likes += like_delta
+    dislikes += dislike_delta
+    
+    # One write per document: the comment counts, the reacting user's lists, the owner's aura
+    comments_collection.update_one(
+        {"comment_id": comment_id},
+        {"$inc": {"likes": like_delta, "dislikes": dislike_delta}}
+    )
+    user_update = {}
+    if initial:
+        user_update["$pull"] = {f"{initial}_comments": comment_id}
+    if final:
+        user_update["$addToSet"] = {f"{final}_comments": comment_id}
+    users_collection.update_one({"telegram_id": user_id}, user_update)
+    update_user_aura(comment_owner_id, REACTION_AURA[final] - REACTION_AURA[initial])
+    
+    if final:
+        result = final
+    else:
+        result = "like_removed" if initial == "liked" else "dislike_removed"
+    return result, likes, dislikes, comment
 
 # Get comments for confession (OLDEST FIRST - new at bottom)
-def get_comments_for_confession(confession_id):
+def get_comments_for_confession(confession_id, archived=False):
     # Get all comments for this confession, sorted by timestamp (OLDEST FIRST for display)
-    all_comments = list(comments_collection.find(
+    all_comments = list(reads(comments_collection, "thread").find(
         {"confession_id": confession_id}
     ).sort("timestamp", 1))  # 1 for ascending (oldest first) - NEW AT BOTTOM
     
+    # Archived threads live in one compressed document (older than anything still hot)
+    if archived:
+        archive = reads(archived_confessions_collection, "thread").find_one({"_id": confession_id}, {"comments": 1})
+        if archive:
+            all_comments = unpack_comments(archive["comments"]) + all_comments
+    
     # Separate regular comments and replies
     regular_comments = []
     replies_by_parent = {}
@@ -310,35 +1122,33 @@ def get_comments_for_confession(confession_id):
     return regular_comments, replies_by_parent, total_comments
 
 # Get single comment with user info
-def get_comment_with_user_info(comment_id, current_user_id=None):
+def get_comment_with_user_info(comment_id):
     comment = comments_collection.find_one({"comment_id": comment_id})
     if not comment:
         return None
-    
-    user = get_or_create_user(comment["user_id"])
-    comment_owner = {
-        "nickname": user.get("nickname", "Anonymous"),
-        "profile_emoji": user.get("profile_emoji", "👤"),
-        "aura": user.get("aura", 0)
-    }
-    
-    # Check if current user has liked/disliked this comment
-    user_liked = False
-    user_disliked = False
-    
-    if current_user_id:
-        current_user = get_or_create_user(current_user_id)
-        liked_comments = current_user.get("liked_comments", [])
-        disliked_comments = current_user.get("disliked_comments", [])
-        user_liked = comment_id in liked_comments
-        user_disliked = comment_id in disliked_comments
-    
-    return {
-        **comment,
-        "user_info": comment_owner,
-        "user_liked": user_liked,
-        "user_disliked": user_disliked
+    return add_user_info([comment])[0]
+
+# Attach each author's profile to the comments, all authors read in one query
+def add_user_info(comments):
+    author_ids = list({comment["user_id"] for comment in comments})
+    authors = {
+        user["telegram_id"]: user
+        for user in reads(users_collection, "thread").find(
+            {"telegram_id": {"$in": author_ids}}, {"telegram_id": 1, "nickname": 1, "profile_emoji": 1, "aura": 1}
+        )
     }
+    with_info = []
+    for comment in comments:
+        user = authors.get(comment["user_id"], {})
+        with_info.append({
+            **comment,
+            "user_info": {
+                "nickname": user.get("nickname", "Anonymous"),
+                "profile_emoji": user.get("profile_emoji", "👤"),
+                "aura": user.get("aura", 0)
+            }
+        })
+    return with_info
 
 # Store channel post info
 def store_channel_post(confession_id, message_id):
@@ -372,17 +1182,29 @@ async def update_channel_post_button(confession_id, context):
             print(f"Error updating channel post: {e}")
 
 # Send confession to admin for approval
-async def send_to_admin(confession_id, user_text, user_id, context):
+async def send_to_admin(confession_id, user_text, user_id, context, duplicates=()):
     buttons = [
         [InlineKeyboardButton("✅ Approve", callback_data=f"approve_{confession_id}")],
         [InlineKeyboardButton("❌ Reject", callback_data=f"reject_{confession_id}")]
     ]
+    warning = ""
+    if duplicates:
+        matches = ", ".join(f"#{d['_id']} ({d['status']}, {d['similarity']:.0%})" for d in duplicates[:3])
+        warning = f"\n\n⚠️ Possible duplicate of {matches}"
     await context.bot.send_message(
         chat_id=int(ADMIN_CHAT_ID),
-        text=f"New confession received (ID: #{confession_id}):\n\n{user_text}",
+        text=f"New confession received (ID: #{confession_id}):\n\n{user_text}{warning}",
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
+# Timestamps stored as strings are normally ISO 8601; dateutil is only needed for anything else
+def parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil import parser
+        return parser.parse(value)
+
 # Format comment display
 def format_comment_display(comment_data, is_reply=False, parent_comment_info=None):
     comment = comment_data
@@ -391,8 +1213,7 @@ def format_comment_display(comment_data, is_reply=False, parent_comment_info=Non
     # Format timestamp
     timestamp = comment.get("timestamp", datetime.now())
     if isinstance(timestamp, str):
-        from dateutil import parser
-        timestamp = parser.parse(timestamp)
+        timestamp = parse_timestamp(timestamp)
     
     time_str = timestamp.strftime("%H:%M")
     
@@ -412,9 +1233,61 @@ def format_comment_display(comment_data, is_reply=False, parent_comment_info=Non
     
     return display_text
 
+# Flood guard: per-user token buckets per action class, (tokens per second, burst)
+FLOOD_LIMITS = {
+    "heavy": (0.5, 4),
+    "reaction": (4, 12),
+    # A whole submission (confess, text, submit, categories, final submit) fits in one burst
+    "write": (1, 10),
+    "navigation": (2, 10),
+}
+# Updates queued or in flight before cheap-to-skip actions are shed for everyone
+SHED_BACKLOG = int(os.getenv("SHED_BACKLOG", "50"))
+flood_guard = FloodGuard(FLOOD_LIMITS, sheddable=("heavy", "navigation"), shed_backlog=SHED_BACKLOG)
+
+# Action class per callback route; admin moderation is never limited.
+# Steps of a multi-step flow count as writes so shedding never strands a user halfway through one.
+ACTION_CLASSES = {
+    "view_comments": "heavy", "browse_confessions": "heavy", "browse_page": "heavy", "browse_cat": "heavy",
+    "search_page": "heavy", "trending": "heavy", "leaderboard": "heavy",
+    "my_comments": "heavy", "my_confessions": "heavy",
+    "like_comment": "reaction", "dislike_comment": "reaction",
+    "add_comment": "write", "reply_comment": "write", "submit_confess": "write", "final_submit": "write",
+    "confess": "write", "cancel_confess": "write", "edit_confess": "write", "category": "write",
+    "delete_confess": "write", "browse_search": "write",
+    "edit_profile": "write", "change_emoji": "write", "set_emoji": "write", "change_nickname": "write",
+    "approve": "admin", "reject": "admin",
+}
+
+def callback_action(update):
+    return ACTION_CLASSES.get(callback_route(update), "navigation")
+
+# A deep link opens a confession with its comment count; a bare /start is just the menu
+def start_action(update):
+    return "heavy" if update.message and " " in (update.message.text or "") else "navigation"
+
+def message_action(update):
+    return "write"
+
+# Reply to a shed update: callback queries must be answered anyway, messages only on the first shed
+async def shed_update(update, reason, warn):
+    if reason == "overload":
+        text = "The bot is busy right now, please try again in a moment."
+    else:
+        text = "Slow down a little and try again in a few seconds."
+    if update.callback_query:
+        await update.callback_query.answer(text)
+    elif warn and update.effective_message:
+        await update.effective_message.reply_text(text)
+
 # Start command handler with deep linking support
+@flood_guard.guard("start", start_action, shed_update)
+@instrument_handler("start")
+@profile_update("start")
+@with_causal_session
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
+    context.user_data.pop('searching', None)
     user = get_or_create_user(user_id)
 
     # Check for deep link parameter
@@ -423,12 +1296,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if args and args[0].startswith("confession_"):
         try:
             confession_id = int(args[0].replace("confession_", ""))
-            confession = get_confession_by_id(confession_id)
+            confession = get_confession_by_id(confession_id, "deep_link")
             
             if confession:
-                comments_count = comments_collection.count_documents({"confession_id": confession_id})
+                comments_count = get_comment_count(confession, "deep_link")
                 
-                confession_text = confession.get('text', '')
+                confession_text = confession_display_text(confession)
                 message_text = f"📄 Confession #{confession_id}\n\n{confession_text}\n\n💬 Comments: {comments_count}"
                 
                 buttons = [
@@ -436,6 +1309,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     [InlineKeyboardButton("📝 View Comments", callback_data=f"view_comments_{confession_id}")],
                     [InlineKeyboardButton("🏠 Main Menu", callback_data="back_to_main")]
                 ]
+                if confession.get("archived"):
+                    message_text += "\n🗄 Archived: comments are closed"
+                    buttons.pop(0)
                 
                 await update.message.reply_text(message_text, reply_markup=InlineKeyboardMarkup(buttons))
                 return
@@ -451,6 +1327,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("Confess", callback_data="confess")],
         [InlineKeyboardButton("Profile", callback_data="profile")],
+        [InlineKeyboardButton("Browse Confessions", callback_data="browse_confessions")],
+        [InlineKeyboardButton("🔥 Trending", callback_data="trending")],
         [InlineKeyboardButton("Rules", callback_data="rules")]
     ]
     await update.message.reply_text(
@@ -458,20 +1336,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-# Send individual comment as separate message
-async def send_single_comment(comment_data, confession_id, query, is_reply=False, parent_comment_info=None):
-    display_text = format_comment_display(comment_data, is_reply, parent_comment_info)
-    
-    # Get like/dislike counts
-    likes = comment_data.get('likes', 0)
-    dislikes = comment_data.get('dislikes', 0)
-    reply_count = comment_data.get('reply_count', 0)
-    
-    # Create buttons with counts ON THE BUTTONS
+# Buttons under a comment message: counts on the reaction buttons, then navigation
+def comment_keyboard(comment_id, confession_id, likes, dislikes, reply_count):
     comment_buttons = [
-        InlineKeyboardButton(f"👍 {likes}", callback_data=f"like_comment_{comment_data['comment_id']}"),
-        InlineKeyboardButton(f"👎 {dislikes}", callback_data=f"dislike_comment_{comment_data['comment_id']}"),
-        InlineKeyboardButton(f"💬 Reply ({reply_count})", callback_data=f"reply_comment_{comment_data['comment_id']}")
+        InlineKeyboardButton(f"👍 {likes}", callback_data=f"like_comment_{comment_id}"),
+        InlineKeyboardButton(f"👎 {dislikes}", callback_data=f"dislike_comment_{comment_id}"),
+        InlineKeyboardButton(f"💬 Reply ({reply_count})", callback_data=f"reply_comment_{comment_id}")
     ]
     
     # Action buttons below the comment
@@ -484,18 +1354,171 @@ async def send_single_comment(comment_data, confession_id, query, is_reply=False
     # Combine all buttons
     all_buttons = [comment_buttons]
     all_buttons.extend(action_buttons)
+    return InlineKeyboardMarkup(all_buttons)
+
+# Send individual comment as separate message
+async def send_single_comment(comment_data, confession_id, query, is_reply=False, parent_comment_info=None, archived=False):
+    display_text = format_comment_display(comment_data, is_reply, parent_comment_info)
+    
+    if archived:
+        # Archived threads are read-only: counts in the text, navigation only
+        display_text += f"\n👍 {comment_data.get('likes', 0)}  👎 {comment_data.get('dislikes', 0)}"
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
+            [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
+        ])
+    else:
+        # Create buttons with counts ON THE BUTTONS
+        keyboard = comment_keyboard(
+            comment_data['comment_id'], confession_id,
+            comment_data.get('likes', 0), comment_data.get('dislikes', 0), comment_data.get('reply_count', 0)
+        )
     
     # Send as new message
-    await query.message.reply_text(
-        display_text,
-        reply_markup=InlineKeyboardMarkup(all_buttons)
+    await query.message.reply_text(display_text, reply_markup=keyboard)
+
+# Text and buttons for one page of approved confessions (optionally filtered by category or search text)
+def browse_page(category=None, before_id=None, search=None, results=(), offset=0):
+    if search:
+        confessions, has_more = search_results_page(results, offset)
+    else:
+        confessions, has_more = browse_confessions(category, before_id)
+    
+    if search:
+        message_text = f"🔎 Results for \"{search}\"\n\n"
+    elif category:
+        message_text = f"📚 Confessions in #{category.replace(' ', '')}\n\n"
+    else:
+        message_text = "📚 Latest Confessions\n\n"
+    
+    if not confessions:
+        message_text += "No confessions found."
+    for conf in confessions:
+        text = ' '.join(conf.get('text', '').split())
+        text_preview = text[:80] + '...' if len(text) > 80 else text
+        message_text += f"#{conf['confession_id']}: {text_preview}\n\n"
+    
+    buttons = []
+    if confessions:
+        buttons.append([InlineKeyboardButton(f"📄 #{conf['confession_id']}", callback_data=f"view_confession_{conf['confession_id']}") for conf in confessions])
+    if has_more:
+        last_id = confessions[-1]['confession_id']
+        next_data = f"search_page_{offset + BROWSE_PAGE_SIZE}" if search else f"browse_page_{last_id}_{category or ''}"
+        buttons.append([InlineKeyboardButton("Next ▶", callback_data=next_data)])
+    buttons.append([
+        InlineKeyboardButton("🏷 Categories", callback_data="browse_filter"),
+        InlineKeyboardButton("🔎 Search", callback_data="browse_search")
+    ])
+    buttons.append([InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")])
+    return message_text, InlineKeyboardMarkup(buttons)
+
+async def show_browse_page(query, category=None, before_id=None, search=None, results=(), offset=0):
+    message_text, keyboard = browse_page(category, before_id, search, results, offset)
+    await query.edit_message_text(message_text, reply_markup=keyboard)
+
+# Pending like/dislike taps per (user, comment); flushed as one net change
+REACTION_DEBOUNCE_SECONDS = float(os.getenv("REACTION_DEBOUNCE_SECONDS", "0.6"))
+
+async def flush_comment_reaction(key, taps):
+    user_id, comment_id = key
+    query = taps[-1][1]
+    with track("reaction_flush"), causal_session([user_id]):
+        result, new_likes, new_dislikes, comment = apply_comment_reactions(comment_id, user_id, [reaction_type for reaction_type, _ in taps])
+        if not comment:
+            return
+        if result in ("liked", "disliked"):
+            trending_tracker.record(comment["confession_id"], REACTION_WEIGHT)
+        
+        # Only the counts on the buttons change: edit the keyboard, not the text
+        keyboard = comment_keyboard(comment_id, comment["confession_id"], new_likes, new_dislikes, comment.get("reply_count", 0))
+        if query.message and query.message.reply_markup == keyboard:
+            return
+        await query.edit_message_reply_markup(reply_markup=keyboard)
+
+reaction_debouncer = Debouncer(REACTION_DEBOUNCE_SECONDS, flush_comment_reaction)
+
+# Save the trending scores so a restart doesn't lose them
+# Each replica saves its own scores; with one replica that is the plain "snapshot" document
+TRENDING_SNAPSHOT_ID = f"snapshot:{REPLICA_ID}" if REPLICA_ID else "snapshot"
+
+def save_trending_snapshot():
+    trending_collection.replace_one(
+        {"_id": TRENDING_SNAPSHOT_ID},
+        {**trending_tracker.snapshot(), "saved_at": datetime.now()},
+        upsert=True
     )
 
+# Pick up the other replicas' scores so every replica shows the same trending list
+def load_trending_peers():
+    trending_tracker.set_peers(trending_collection.find({"_id": {"$regex": "^snapshot", "$ne": TRENDING_SNAPSHOT_ID}}))
+
+async def snapshot_trending(context):
+    save_trending_snapshot()
+    load_trending_peers()
+
+# Hottest confessions, from the in-memory top-K plus one lookup for their text
+def trending_page():
+    top = trending_tracker.trending()
+    texts = {
+        conf["confession_id"]: conf.get("text", "")
+        for conf in confessions_collection.find(
+            {"confession_id": {"$in": [confession_id for confession_id, _ in top]}},
+            {"_id": 0, "confession_id": 1, "text": 1}
+        )
+    } if top else {}
+    ranked = [confession_id for confession_id, _ in top if confession_id in texts]
+    
+    if not ranked:
+        message_text = "🔥 Trending\n\nNothing is trending right now."
+    else:
+        message_text = "🔥 Trending Confessions\n\n"
+        for position, confession_id in enumerate(ranked, 1):
+            text = ' '.join(texts[confession_id].split())
+            text_preview = text[:60] + '...' if len(text) > 60 else text
+            message_text += f"{position}. #{confession_id}: {text_preview}\n\n"
+    
+    buttons = [
+        [InlineKeyboardButton(f"📄 #{confession_id}", callback_data=f"view_confession_{confession_id}") for confession_id in ranked[i:i+5]]
+        for i in range(0, len(ranked), 5)
+    ]
+    buttons.append([InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")])
+    return message_text, InlineKeyboardMarkup(buttons)
+
+# Callback routes that carry a parameter after the prefix
+CALLBACK_PREFIXES = (
+    "set_emoji_", "category_", "view_confession_", "add_comment_", "view_comments_",
+    "like_comment_", "dislike_comment_", "reply_comment_", "delete_confess_", "approve_", "reject_",
+    "browse_page_", "browse_cat_", "search_page_"
+)
+
+# Metrics label for a callback query: the branch of button_handler it hits
+def callback_route(update):
+    data = update.callback_query.data if update.callback_query else ""
+    for prefix in CALLBACK_PREFIXES:
+        if data.startswith(prefix):
+            return prefix.rstrip("_")
+    return data
+
+# Admin statistics, only in the admin chat
+@instrument_handler("stats")
+@profile_update("stats")
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return
+    await update.message.reply_text(stats_page())
+
 # Main button handler
+@flood_guard.guard("button_handler", callback_action, shed_update)
+@instrument_handler("button_handler", route=callback_route)
+@profile_update("button_handler")
+@with_causal_session
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
+    # Any other button abandons a pending search, so the next message goes to that flow instead
+    if query.data != "browse_search":
+        context.user_data.pop('searching', None)
 
     # Confess
     if query.data == "confess":
@@ -511,6 +1534,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         main_keyboard = [
             [InlineKeyboardButton("Confess", callback_data="confess")],
             [InlineKeyboardButton("Profile", callback_data="profile")],
+            [InlineKeyboardButton("Browse Confessions", callback_data="browse_confessions")],
+            [InlineKeyboardButton("🔥 Trending", callback_data="trending")],
             [InlineKeyboardButton("Rules", callback_data="rules")]
         ]
         await query.edit_message_text(
@@ -520,7 +1545,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Profile menu
     elif query.data == "profile":
-        user = get_or_create_user(user_id)
+        user = get_user(user_id, "profile")
         context.user_data['nickname'] = user.get('nickname', 'Anonymous')
         context.user_data['profile_emoji'] = user.get('profile_emoji', '👤')
         context.user_data['aura'] = user.get('aura', 0)
@@ -530,11 +1555,27 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("Edit Profile", callback_data="edit_profile")],
             [InlineKeyboardButton("My Confessions", callback_data="my_confessions")],
             [InlineKeyboardButton("My Comments", callback_data="my_comments")],
+            [InlineKeyboardButton("🏆 Leaderboard", callback_data="leaderboard")],
             [InlineKeyboardButton("⬅ Back", callback_data="back_to_main")]
         ]
-        profile_text = f"{context.user_data['profile_emoji']} {context.user_data['nickname']}\n\n⚡️ Aura: {context.user_data['aura']}"
+        rank = aura_ranks.rank(context.user_data['aura'])
+        profile_text = (
+            f"{context.user_data['profile_emoji']} {context.user_data['nickname']}\n\n"
+            f"⚡️ Aura: {context.user_data['aura']}\n"
+            f"🏆 Rank: #{rank} of {aura_ranks.total}"
+        )
         await query.edit_message_text(profile_text, reply_markup=InlineKeyboardMarkup(profile_keyboard))
 
+    elif query.data == "leaderboard":
+        top_users = get_top_users(LEADERBOARD_SHOWN)
+        message_text = "🏆 Aura Leaderboard\n\n"
+        for position, top_user in enumerate(top_users, 1):
+            message_text += f"{position}. {top_user.get('profile_emoji', '👤')} {top_user.get('nickname', 'Anonymous')} ⚡︎ {top_user.get('aura', 0)}\n"
+        user_aura = get_or_create_user(user_id).get('aura', 0)
+        message_text += f"\nYour rank: #{aura_ranks.rank(user_aura)} of {aura_ranks.total}"
+        buttons = [[InlineKeyboardButton("⬅ Back to Profile", callback_data="profile")]]
+        await query.edit_message_text(message_text, reply_markup=InlineKeyboardMarkup(buttons))
+
     elif query.data == "edit_profile":
         edit_profile_keyboard = [
             [InlineKeyboardButton("Change Profile Emoji", callback_data="change_emoji")],
@@ -572,6 +1613,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         main_keyboard = [
             [InlineKeyboardButton("Confess", callback_data="confess")],
             [InlineKeyboardButton("Profile", callback_data="profile")],
+            [InlineKeyboardButton("Browse Confessions", callback_data="browse_confessions")],
+            [InlineKeyboardButton("🔥 Trending", callback_data="trending")],
             [InlineKeyboardButton("Rules", callback_data="rules")]
         ]
         await query.edit_message_text("Welcome to Confession Bot! Choose an option:", reply_markup=InlineKeyboardMarkup(main_keyboard))
@@ -582,7 +1625,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(rules_text, reply_markup=InlineKeyboardMarkup(rules_keyboard))
 
     elif query.data == "my_comments":
-        user = get_or_create_user(user_id)
+        user = get_user(user_id, "profile")
         user_comments = user.get('comments', [])
         
         if not user_comments:
@@ -602,6 +1645,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif query.data == "my_confessions":
         user_confessions = context.user_data.get('confessions', [])
+        # Archived ones are no longer in the user document (the cached copy may predate the move)
+        archived = get_archived_confessions(user_id, "profile")
+        archived_ids = {conf['confession_id'] for conf in archived}
+        user_confessions = archived + [conf for conf in user_confessions if conf['confession_id'] not in archived_ids]
         if not user_confessions:
             message_text = "You haven't confessed yet."
             buttons = [[InlineKeyboardButton("Submit New Confession", callback_data="confess")]]
@@ -609,7 +1656,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message_text = "📜 Your Confessions (Page 1/1)\n\n"
             buttons = []
             for idx, conf in enumerate(user_confessions, 1):
-                status_icon = "✅ Approved" if conf.get('status') == 'approved' else "⏳ Pending"
+                if conf.get('archived'):
+                    status_icon = "🗄 Archived"
+                else:
+                    status_icon = "✅ Approved" if conf.get('status') == 'approved' else "⏳ Pending"
                 text_preview = conf.get('text', '')[:50] + '...' if len(conf.get('text', '')) > 50 else conf.get('text', '')
                 message_text += f"ID: #{conf['confession_id']} ({status_icon})\n\"{text_preview}\"\n\n"
                 if conf.get('status') == 'pending':
@@ -617,11 +1667,52 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             buttons.append([InlineKeyboardButton("Submit New Confession", callback_data="confess")])
         await query.edit_message_text(message_text, reply_markup=InlineKeyboardMarkup(buttons))
 
+    elif query.data == "trending":
+        message_text, keyboard = trending_page()
+        await query.edit_message_text(message_text, reply_markup=keyboard)
+
+    # Browse approved confessions, newest first
+    elif query.data == "browse_confessions":
+        await show_browse_page(query)
+
+    elif query.data.startswith("browse_page_"):
+        _, _, before_id, category = query.data.split("_", 3)
+        await show_browse_page(query, category or None, int(before_id))
+
+    elif query.data == "browse_filter":
+        counts = get_category_counts()
+        category_keyboard = [
+            [InlineKeyboardButton(f"{cat} ({counts.get(cat, {}).get('approved', 0)})", callback_data=f"browse_cat_{cat}") for cat in CONFESSION_CATEGORIES[i:i+3]]
+            for i in range(0, len(CONFESSION_CATEGORIES), 3)
+        ]
+        category_keyboard.append([InlineKeyboardButton("All Categories", callback_data="browse_confessions")])
+        await query.edit_message_text("Choose a category to browse:", reply_markup=InlineKeyboardMarkup(category_keyboard))
+
+    elif query.data.startswith("browse_cat_"):
+        await show_browse_page(query, query.data.replace("browse_cat_", ""))
+
+    elif query.data == "browse_search":
+        context.user_data['searching'] = True
+        buttons = [[InlineKeyboardButton("❌ Cancel", callback_data="browse_confessions")]]
+        await query.edit_message_text("Send the words to search for:", reply_markup=InlineKeyboardMarkup(buttons))
+
+    elif query.data.startswith("search_page_"):
+        search = context.user_data.get('search_query')
+        if search:
+            # Later pages reuse the ranked ids from the first search; user_data is per process, so a restart
+            # or another replica taking the update misses
+            results = context.user_data.get('search_results')
+            record_cache("search_results", results is not None)
+            if results is None:
+                results = context.user_data['search_results'] = search_confessions(search)
+            await show_browse_page(query, search=search, results=results, offset=int(query.data.replace("search_page_", "")))
+        else:
+            await show_browse_page(query)
+
     # Confession category & final submit logic
     elif query.data == "submit_confess":
         context.user_data['selected_categories'] = set()
-        categories = ["family","sexual assult","addition","friendship","relation ship","couples","truama","mental",
-                      "sexual","crush","rape","harassment","school","collage","university","highschool","others"]
+        categories = CONFESSION_CATEGORIES
         category_keyboard = [[InlineKeyboardButton(cat, callback_data=f"category_{cat}") for cat in categories[i:i+3]] for i in range(0, len(categories), 3)]
         category_keyboard.append([InlineKeyboardButton("⬅ Back", callback_data="review_confess")])
         await query.edit_message_text("Choose at least 3 categories:", reply_markup=InlineKeyboardMarkup(category_keyboard))
@@ -635,8 +1726,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             context.user_data['selected_categories'].add(selected_cat)
 
-        categories = ["family","sexual assult","addition","friendship","relation ship","couples","truama","mental",
-                      "sexual","crush","rape","harassment","school","collage","university","highschool","others"]
+        categories = CONFESSION_CATEGORIES
         category_keyboard = []
         for i in range(0, len(categories), 3):
             row = []
@@ -655,14 +1745,34 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         confession_text = context.user_data.get('confession', '')
-        hashtags = ' '.join([f"#{cat.replace(' ', '')}" for cat in context.user_data['selected_categories']])
-        final_text = f"{confession_text}\n\n{hashtags}"
+        categories = [cat for cat in CONFESSION_CATEGORIES if cat in context.user_data['selected_categories']]
+
+        # Same text resubmitted by the same user: fold into the earlier one (no new ID, no admin message)
+        fingerprint = Fingerprint(confession_text)
+        duplicates = find_duplicates(fingerprint)
+        resubmitted = next((
+            d for d in duplicates
+            if d["user_id"] == user_id and d["exact"] == fingerprint.exact and d["status"] != "rejected"
+        ), None)
+        if resubmitted:
+            DUPLICATE_SUBMISSIONS.inc(kind="exact", action="folded")
+            await query.edit_message_text(
+                f"You already submitted this confession (#{resubmitted['_id']}, {resubmitted['status']})."
+            )
+            context.user_data.pop('confession', None)
+            context.user_data.pop('selected_categories', None)
+            return
 
         # Save confession to DB
-        confession_id = add_confession(user_id, final_text)
+        confession_id = add_confession(user_id, confession_text, categories=categories)
+        store_fingerprint(confession_id, user_id, fingerprint)
 
-        # Send to admin group for approval
-        await send_to_admin(confession_id, final_text, user_id, context)
+        # Send to admin group for approval, flagging anything it duplicates
+        if duplicates:
+            kind = "exact" if duplicates[0]["similarity"] == 1.0 else "near"
+            DUPLICATE_SUBMISSIONS.inc(kind=kind, action="flagged")
+        final_text = confession_display_text({"text": confession_text, "categories": categories})
+        await send_to_admin(confession_id, final_text, user_id, context, duplicates)
 
         await query.edit_message_text("Your confession has been sent to admins for approval.")
         context.user_data.pop('confession', None)
@@ -672,12 +1782,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # View confession from channel post (via deep link)
     elif query.data.startswith("view_confession_"):
         confession_id = int(query.data.replace("view_confession_", ""))
-        confession = get_confession_by_id(confession_id)
+        confession = get_confession_by_id(confession_id, "deep_link")
         
         if confession:
-            comments_count = comments_collection.count_documents({"confession_id": confession_id})
+            comments_count = get_comment_count(confession, "deep_link")
             
-            confession_text = confession.get('text', '')
+            confession_text = confession_display_text(confession)
             message_text = f"📄 Confession #{confession_id}\n\n{confession_text}\n\n💬 Comments: {comments_count}"
             
             buttons = [
@@ -685,6 +1795,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("📝 View Comments", callback_data=f"view_comments_{confession_id}")],
                 [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
             ]
+            if confession.get("archived"):
+                message_text += "\n🗄 Archived: comments are closed"
+                buttons.pop(0)
             
             await query.edit_message_text(message_text, reply_markup=InlineKeyboardMarkup(buttons))
         else:
@@ -693,6 +1806,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Add comment to confession
     elif query.data.startswith("add_comment_"):
         confession_id = int(query.data.replace("add_comment_", ""))
+        if archived_confessions_collection.find_one({"_id": confession_id}, {"_id": 1}):
+            await query.answer("This confession is archived; comments are closed.", show_alert=True)
+            return
         context.user_data['commenting_on'] = confession_id
         context.user_data['commenting'] = True
         context.user_data['is_reply'] = False  # Regular comment, not a reply
@@ -703,143 +1819,53 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # View comments for confession - EACH COMMENT AS SEPARATE MESSAGE (OLDEST FIRST, NEW AT BOTTOM)
     elif query.data.startswith("view_comments_"):
         confession_id = int(query.data.replace("view_comments_", ""))
+        archived = reads(archived_confessions_collection, "thread").find_one({"_id": confession_id}, {"_id": 1}) is not None
         
         # Get all comments and replies for this confession (OLDEST FIRST)
-        regular_comments, replies_by_parent, total_comments = get_comments_for_confession(confession_id)
+        regular_comments, replies_by_parent, total_comments = get_comments_for_confession(confession_id, archived)
+        
+        header_buttons = [
+            [InlineKeyboardButton("💬 Add Comment", callback_data=f"add_comment_{confession_id}")],
+            [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
+            [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
+        ]
+        if archived:
+            header_buttons.pop(0)
         
         if not regular_comments and not replies_by_parent:
             # Show message that there are no comments
             await query.edit_message_text(
                 f"📝 Comments for Confession #{confession_id}\n\nNo comments yet. Be the first to comment!",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("💬 Add Comment", callback_data=f"add_comment_{confession_id}")],
-                    [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
-                    [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
-                ])
+                reply_markup=InlineKeyboardMarkup(header_buttons)
             )
         else:
             # Send a header message
             await query.edit_message_text(
                 f"📝 Showing comments for Confession #{confession_id} (Oldest first, newest at bottom):",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("💬 Add Comment", callback_data=f"add_comment_{confession_id}")],
-                    [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
-                    [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
-                ])
+                reply_markup=InlineKeyboardMarkup(header_buttons)
             )
             
+            all_comments = regular_comments + [reply for replies in replies_by_parent.values() for reply in replies]
+            with_info = {comment["comment_id"]: comment for comment in add_user_info(all_comments)}
+            
             # Send each comment as a separate message (oldest first, newest at bottom)
             for comment in regular_comments:
-                comment_data = get_comment_with_user_info(comment['comment_id'], user_id)
-                if comment_data:
-                    # Send the main comment
-                    await send_single_comment(comment_data, confession_id, query)
-                    
-                    # Send replies to this comment if any
-                    parent_comment_id = comment['comment_id']
-                    if parent_comment_id in replies_by_parent:
-                        for reply in replies_by_parent[parent_comment_id]:
-                            reply_data = get_comment_with_user_info(reply['comment_id'], user_id)
-                            if reply_data:
-                                # Get parent comment info for display
-                                parent_info = get_comment_with_user_info(parent_comment_id, user_id)
-                                await send_single_comment(reply_data, confession_id, query, is_reply=True, parent_comment_info=parent_info)
-
-    # Handle like on comment
-    elif query.data.startswith("like_comment_"):
-        comment_id = int(query.data.replace("like_comment_", ""))
-        result, new_likes, new_dislikes = handle_comment_reaction(comment_id, user_id, "like")
-        
-        # Find confession_id from the comment
-        comment = comments_collection.find_one({"comment_id": comment_id})
-        if comment:
-            confession_id = comment["confession_id"]
-            is_reply = comment.get("is_reply", False)
-            parent_comment_id = comment.get("parent_comment_id")
-            
-            # Update the specific comment message
-            comment_data = get_comment_with_user_info(comment_id, user_id)
-            if comment_data:
-                # Get parent comment info if this is a reply
-                parent_comment_info = None
-                if is_reply and parent_comment_id:
-                    parent_comment_info = get_comment_with_user_info(parent_comment_id, user_id)
-                
-                # Edit the message with updated like count
-                display_text = format_comment_display(comment_data, is_reply, parent_comment_info)
-                
-                # Create buttons with updated counts
-                reply_count = comment_data.get('reply_count', 0)
-                comment_buttons = [
-                    InlineKeyboardButton(f"👍 {new_likes}", callback_data=f"like_comment_{comment_id}"),
-                    InlineKeyboardButton(f"👎 {new_dislikes}", callback_data=f"dislike_comment_{comment_id}"),
-                    InlineKeyboardButton(f"💬 Reply ({reply_count})", callback_data=f"reply_comment_{comment_id}")
-                ]
+                comment_data = with_info[comment["comment_id"]]
+                # Send the main comment
+                await send_single_comment(comment_data, confession_id, query, archived=archived)
                 
-                # Action buttons below the comment
-                action_buttons = [
-                    [InlineKeyboardButton("💬 Add New Comment", callback_data=f"add_comment_{confession_id}")],
-                    [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
-                    [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
-                ]
-                
-                # Combine all buttons
-                all_buttons = [comment_buttons]
-                all_buttons.extend(action_buttons)
-                
-                # Edit the message
-                await query.edit_message_text(
-                    display_text,
-                    reply_markup=InlineKeyboardMarkup(all_buttons)
-                )
+                # Send replies to this comment if any, showing the parent they answer
+                parent_comment_id = comment['comment_id']
+                if parent_comment_id in replies_by_parent:
+                    for reply in replies_by_parent[parent_comment_id]:
+                        reply_data = with_info[reply["comment_id"]]
+                        await send_single_comment(reply_data, confession_id, query, is_reply=True, parent_comment_info=comment_data, archived=archived)
 
-    # Handle dislike on comment
-    elif query.data.startswith("dislike_comment_"):
-        comment_id = int(query.data.replace("dislike_comment_", ""))
-        result, new_likes, new_dislikes = handle_comment_reaction(comment_id, user_id, "dislike")
-        
-        # Find confession_id from the comment
-        comment = comments_collection.find_one({"comment_id": comment_id})
-        if comment:
-            confession_id = comment["confession_id"]
-            is_reply = comment.get("is_reply", False)
-            parent_comment_id = comment.get("parent_comment_id")
-            
-            # Update the specific comment message
-            comment_data = get_comment_with_user_info(comment_id, user_id)
-            if comment_data:
-                # Get parent comment info if this is a reply
-                parent_comment_info = None
-                if is_reply and parent_comment_id:
-                    parent_comment_info = get_comment_with_user_info(parent_comment_id, user_id)
-                
-                # Edit the message with updated dislike count
-                display_text = format_comment_display(comment_data, is_reply, parent_comment_info)
-                
-                # Create buttons with updated counts
-                reply_count = comment_data.get('reply_count', 0)
-                comment_buttons = [
-                    InlineKeyboardButton(f"👍 {new_likes}", callback_data=f"like_comment_{comment_id}"),
-                    InlineKeyboardButton(f"👎 {new_dislikes}", callback_data=f"dislike_comment_{comment_id}"),
-                    InlineKeyboardButton(f"💬 Reply ({reply_count})", callback_data=f"reply_comment_{comment_id}")
-                ]
-                
-                # Action buttons below the comment
-                action_buttons = [
-                    [InlineKeyboardButton("💬 Add New Comment", callback_data=f"add_comment_{confession_id}")],
-                    [InlineKeyboardButton("📄 View Confession", callback_data=f"view_confession_{confession_id}")],
-                    [InlineKeyboardButton("⬅ Back to Main", callback_data="back_to_main")]
-                ]
-                
-                # Combine all buttons
-                all_buttons = [comment_buttons]
-                all_buttons.extend(action_buttons)
-                
-                # Edit the message
-                await query.edit_message_text(
-                    display_text,
-                    reply_markup=InlineKeyboardMarkup(all_buttons)
-                )
+    # Handle like/dislike on comment: rapid taps are coalesced and applied once
+    elif query.data.startswith("like_comment_") or query.data.startswith("dislike_comment_"):
+        reaction_type = "like" if query.data.startswith("like_comment_") else "dislike"
+        comment_id = int(query.data.split("_")[-1])
+        reaction_debouncer.submit((user_id, comment_id), (reaction_type, query))
                 
     # Reply to comment
     # Reply to comment
@@ -847,7 +1873,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
          comment_id = int(query.data.replace("reply_comment_", ""))
      
     # Get comment info for context
-         comment_data = get_comment_with_user_info(comment_id, user_id)
+         comment_data = get_comment_with_user_info(comment_id)
     
          if comment_data:
         # Set reply context
@@ -887,14 +1913,36 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         confession_id = int(query.data.split("_")[1])
         status = "approved" if query.data.startswith("approve_") else "rejected"
 
-        users_collection.update_one(
-            {"confessions.confession_id": confession_id},
+        # Pressing the same button twice changes nothing; a reversal records the decision it replaces
+        status_update = users_collection.update_one(
+            {"confessions": {"$elemMatch": {"confession_id": confession_id, "status": {"$ne": status}}}},
             {"$set": {"confessions.$.status": status}}
         )
+        archived = None
+        if not status_update.matched_count:
+            # Archived confessions are only in their archive copy; its status decides whether deep links show it
+            archived = archived_confessions_collection.find_one_and_update(
+                {"_id": confession_id, "confession.status": {"$ne": status}},
+                {"$set": {"confession.status": status}},
+                projection={"confession": 1}
+            )
+        previous = fingerprints_collection.find_one_and_update(
+            {"_id": confession_id, "status": {"$ne": status}},
+            [{"$set": {
+                "previous_status": "$status", "previous_moderated_at": "$moderated_at",
+                "status": status, "moderated_at": datetime.now(), **stats_pending("stats_moderated")
+            }}],
+            projection={"status": 1}
+        )
 
-        if status == "approved":
+        if status == "approved" and archived:
+            # Posted to the channel before it was archived; only browsing and the counters come back
+            index_approved_confession(archived["confession"])
+            count_categories(archived["confession"].get("categories", []), "approved")
+            await query.edit_message_text(f"Confession #{confession_id} approved ✅")
+        elif status == "approved":
             user = users_collection.find_one({"confessions.confession_id": confession_id})
-            confession = next((c for c in user["confessions"] if c["confession_id"] == confession_id), None)
+            confession = next((c for c in user["confessions"] if c["confession_id"] == confession_id), None) if user else None
             if confession:
                 # Create URL button that opens the bot with deep link
                 bot_url = f"https://t.me/{BOT_USERNAME}?start=confession_{confession_id}"
@@ -908,19 +1956,34 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 # Post to channel and store message ID
                 sent_message = await context.bot.send_message(
                     chat_id=CHANNEL_ID,
-                    text=f"Confession #{confession_id}\n\n{confession['text']}",
+                    text=f"Confession #{confession_id}\n\n{confession_display_text(confession)}",
                     reply_markup=keyboard
                 )
                 
                 # Store channel post info
                 store_channel_post(confession_id, sent_message.message_id)
                 
+                # Make it browsable / searchable in the bot
+                index_approved_confession(confession)
+                # Count it once, even if the approve button is pressed again
+                if status_update.modified_count:
+                    count_categories(confession.get("categories", []), "approved")
+                
             await query.edit_message_text(f"Confession #{confession_id} approved ✅")
         else:
+            # Rejecting an approved confession takes it back out of browsing and the approved counts
+            if previous and previous.get("status") == "approved":
+                withdrawn = confessions_collection.find_one_and_delete({"confession_id": confession_id}, {"categories": 1})
+                if withdrawn:
+                    count_categories(withdrawn.get("categories", []), "approved", -1)
             await query.edit_message_text(f"Confession #{confession_id} rejected ❌")
 
 # Handle text messages (confessions, comments, replies, or nickname)
 # Handle text messages (confessions, comments, replies, or nickname)
+@flood_guard.guard("confession_text", message_action, shed_update)
+@instrument_handler("confession_text")
+@profile_update("confession_text")
+@with_causal_session
 async def confession_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_text = update.message.text.strip()
     user_id = update.effective_user.id
@@ -942,6 +2005,13 @@ async def confession_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         back_button = [[InlineKeyboardButton("⬅ Back to Profile", callback_data="edit_profile")]]
         await update.message.reply_text(f"Nickname updated to: {context.user_data['nickname']}", reply_markup=InlineKeyboardMarkup(back_button))
 
+    elif context.user_data.get('searching'):
+        context.user_data['searching'] = False
+        context.user_data['search_query'] = user_text[:100]
+        context.user_data['search_results'] = search_confessions(context.user_data['search_query'])
+        message_text, keyboard = browse_page(search=context.user_data['search_query'], results=context.user_data['search_results'])
+        await update.message.reply_text(message_text, reply_markup=keyboard)
+
     elif context.user_data.get('commenting'):
         # Check if this is a REPLY to a comment
         if context.user_data.get('replying') and context.user_data.get('is_reply'):
@@ -1009,13 +2079,105 @@ async def confession_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("❌ Cancel", callback_data="cancel_confess")]
         ]
         await update.message.reply_text(f"Here is your confession for review:\n\n{user_text}", reply_markup=InlineKeyboardMarkup(review_keyboard))
-# Main function
-def main():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+# One-off migrations; each leaves a marker behind, so later runs only check for it
+def run_backfills():
+    if not counters_collection.find_one({"_id": "categories_backfilled"}):
+        backfill_confession_categories()
+    elif confessions_collection.estimated_document_count() == 0:
+        backfill_confession_index()
+    if not counters_collection.find_one({"_id": "fingerprints_backfilled"}):
+        backfill_fingerprints()
+
+# Whichever replica holds the lease finishes migrations a previous leader didn't get to
+@leader_only
+async def backfill_job(context):
+    await asyncio.to_thread(run_backfills)
+
+# Connect, build indexes and load in-memory state before the first update is handled
+def warm_up():
+    get_client().admin.command("ping")
+    ensure_indexes()
+    # The leader migrates before serving; the others start without waiting for it
+    if leader_lease.acquire():
+        run_backfills()
+    trending_tracker.restore(trending_collection.find_one({"_id": TRENDING_SNAPSHOT_ID}))
+    load_trending_peers()
+    load_aura_ranks()
+
+async def on_start(application):
+    # Health check and /metrics server; Flask is only imported when the bot actually runs
+    from keep_alive import keep_alive
+    accept_update = None
+    if UPDATE_SOURCE == "router":
+        loop = asyncio.get_running_loop()
+        # Called on the Flask thread: hand the update to the application's queue on the bot's loop
+        def accept_update(data):
+            update = Update.de_json(data, application.bot)
+            loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+    keep_alive(accept_update)
+    warm_up()
+
+# Apply taps still waiting in the debounce window and save trending before the bot stops
+async def on_stop(application):
+    await reaction_debouncer.flush_all()
+    save_trending_snapshot()
+
+async def on_shutdown(application):
+    if _client is not None:
+        # Hand leadership over now rather than after the lease runs out
+        leader_lease.release()
+        _client.close()
+
+# Build the application; nothing connects until it is started
+def build_application():
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        # Same pool size ApplicationBuilder gives its own default request object
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(on_start)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, confession_text))
-    app.run_polling()
+    app.job_queue.run_repeating(snapshot_trending, interval=TRENDING_SNAPSHOT_SECONDS, first=TRENDING_SNAPSHOT_SECONDS)
+    app.job_queue.run_repeating(resync_aura_ranks, interval=LEADERBOARD_RESYNC_SECONDS, first=LEADERBOARD_RESYNC_SECONDS)
+    app.job_queue.run_repeating(archive_job, interval=ARCHIVE_INTERVAL_SECONDS, first=600)
+    app.job_queue.run_repeating(stats_job, interval=STATS_INTERVAL_SECONDS, first=STATS_INTERVAL_SECONDS)
+    app.job_queue.run_repeating(renew_leadership, interval=LEADER_LEASE_SECONDS / 3, first=LEADER_LEASE_SECONDS / 3)
+    app.job_queue.run_repeating(backfill_job, interval=BACKFILL_CHECK_SECONDS, first=BACKFILL_CHECK_SECONDS)
+    return app
+
+# Replica behind router.py: no getUpdates, updates arrive on the keep-alive server
+async def serve_from_router(app):
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stopping.set)
+    await app.initialize()
+    await on_start(app)
+    await app.start()
+    try:
+        await stopping.wait()
+    finally:
+        await app.stop()
+        await on_stop(app)
+        await app.shutdown()
+        await on_shutdown(app)
+
+# Main function
+def main():
+    # Replicas' /telegram endpoint is reachable by anyone who can reach the keep-alive port
+    if UPDATE_SOURCE == "router" and not os.getenv("WEBHOOK_SECRET"):
+        raise SystemExit("UPDATE_SOURCE=router needs WEBHOOK_SECRET, shared with router.py")
+    app = build_application()
+    if UPDATE_SOURCE == "router":
+        asyncio.run(serve_from_router(app))
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import contextvars
+
+
+# Collects items submitted under the same key within `window` seconds and
+# hands them to `flush(key, items)` once, in a background task.
+# Submitting never waits, so later taps are processed while the first one is pending.
+# Flushes are single-flight per key: items arriving while a key is being flushed form
+# the next batch, which is flushed only after the current one has finished.
+class Debouncer:
+    def __init__(self, window, flush):
+        self.window = window
+        self.flush = flush
+        self._pending = {}
+        # One worker per key with pending or in-flight items
+        self._tasks = {}
+        self._waiters = {}
+        self._flushing_all = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Queue an item; returns True if it joined an already pending batch
+    def submit(self, key, item):
+        if key in self._pending:
+            self._pending[key].append(item)
+            return True
+        self._pending[key] = [item]
+        if key not in self._tasks:
+            # Fresh context: the flush must not be attributed to the update that opened the batch
+            self._tasks[key] = asyncio.get_running_loop().create_task(
+                self._worker(key), context=contextvars.Context()
+            )
+        return False
+
+    # Flush the key's batches one at a time until nothing is left for it
+    async def _worker(self, key):
+        try:
+            while key in self._pending:
+                if not self._flushing_all:
+                    await self._wait(key)
+                await self._run(key)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _wait(self, key):
+        loop = asyncio.get_running_loop()
+        waiter = self._waiters[key] = loop.create_future()
+        timer = loop.call_later(self.window, self._wake, key)
+        try:
+            await waiter
+        finally:
+            timer.cancel()
+            self._waiters.pop(key, None)
+
+    def _wake(self, key):
+        waiter = self._waiters.get(key)
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+    async def _run(self, key):
+        items = self._pending.pop(key, None)
+        if not items:
+            return
+        try:
+            await self.flush(key, items)
+        except Exception as e:
+            print(f"Error flushing {key}: {e}")
+
+    # Flush everything now (shutdown, benchmarks) instead of waiting for the window,
+    # and wait for flushes already in flight
+    async def flush_all(self):
+        self._flushing_all = True
+        try:
+            while self._tasks:
+                for key in list(self._waiters):
+                    self._wake(key)
+                await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            self._flushing_all = False
@@ -0,0 +1,67 @@
+import hashlib
+import random
+import re
+import unicodedata
+
+# MinHash signature of BANDS * ROWS values, split into BANDS bands for LSH.
+# Two texts share at least one band with probability 1 - (1 - J**ROWS)**BANDS for
+# word-shingle Jaccard similarity J: ~0.7% at J=0.3, ~71% at J=0.7, ~95% at J=0.8.
+BANDS = 10
+ROWS = 6
+SHINGLE_WORDS = 3
+# Candidates sharing a band count as near-duplicates at this estimated similarity
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must be comparable across processes and restarts
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+_WORD = re.compile(r"\w+")
+
+
+# Case, accents, punctuation and spacing don't make a confession different
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(_WORD.findall(text))
+
+
+def exact_hash(normalized):
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+
+def _shingles(normalized):
+    words = normalized.split()
+    if len(words) < SHINGLE_WORDS:
+        return {normalized} if normalized else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(normalized):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in _shingles(normalized)]
+    if not hashes:
+        return [0] * len(_PERMUTATIONS)
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+# One key per band, stored in an indexed array: a lookup is BANDS index probes
+def band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+# Everything stored and queried for one text
+class Fingerprint:
+    def __init__(self, text):
+        normalized = normalize(text)
+        self.exact = exact_hash(normalized)
+        self.signature = minhash(normalized)
+        self.bands = band_keys(self.signature)
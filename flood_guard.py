@@ -0,0 +1,119 @@
+import functools
+import time
+
+import metrics
+
+
+# Classic token bucket: `rate` tokens per second, holding at most `burst`
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now, cost=1):
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+# One bucket per key, created on demand. A full bucket behaves exactly like a
+# missing one, so idle keys are swept once the map grows past `sweep_at`.
+class RateLimiter:
+    def __init__(self, rate, burst, sweep_at=10_000):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_at = sweep_at
+        self.buckets = {}
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.sweep_at:
+                self._sweep(now)
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket.take(now)
+
+    def _sweep(self, now):
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if not bucket.full(now)}
+        # Everyone is active: make room anyway rather than grow without bound
+        if len(self.buckets) >= self.sweep_at:
+            self.sweep_at *= 2
+
+
+# Per-user, per-action-class limits plus global load shedding.
+# `limits` maps an action class to (rate per second, burst); classes not in it are unlimited.
+# Actions in `sheddable` are refused outright while the backlog is at least `shed_backlog`.
+class FloodGuard:
+    def __init__(self, limits, sheddable=(), shed_backlog=50):
+        self.limiters = {action: RateLimiter(rate, burst) for action, (rate, burst) in limits.items()}
+        self.sheddable = frozenset(sheddable)
+        self.shed_backlog = shed_backlog
+        self.enabled = True
+        self.in_flight = 0
+        # Users already told to slow down, so a spammer costs one reply per burst, not one per message
+        self._warned = set()
+
+    # Updates waiting behind this one plus those still being handled
+    def backlog(self, context):
+        queue = getattr(getattr(context, "application", None), "update_queue", None)
+        return self.in_flight + (queue.qsize() if queue is not None else 0)
+
+    # Why an update should be shed, or None to handle it
+    def check(self, user_id, action, backlog, now=None):
+        if not self.enabled:
+            return None
+        if action in self.sheddable and backlog >= self.shed_backlog:
+            return "overload"
+        limiter = self.limiters.get(action)
+        if limiter is not None and user_id is not None and not limiter.allow(user_id, now):
+            return "rate_limited"
+        self._warned.discard((user_id, action))
+        return None
+
+    # First shed for this user and action since they were last let through
+    def should_warn(self, user_id, action):
+        key = (user_id, action)
+        if key in self._warned:
+            return False
+        if len(self._warned) >= 10_000:
+            self._warned.clear()
+        self._warned.add(key)
+        return True
+
+    # Decorator: run the handler only if check() lets the update through, otherwise
+    # call on_shed(update, reason, warn) and count the shed update
+    def guard(self, name, classify, on_shed):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(update, context):
+                user = update.effective_user
+                user_id = user.id if user else None
+                action = classify(update)
+                backlog = self.backlog(context)
+                metrics.UPDATE_BACKLOG.set(backlog)
+                reason = self.check(user_id, action, backlog)
+                if reason:
+                    metrics.SHED_UPDATES.inc(handler=name, action=action, reason=reason)
+                    await on_shed(update, reason, self.should_warn(user_id, action))
+                    return None
+                self.in_flight += 1
+                try:
+                    return await func(update, context)
+                finally:
+                    self.in_flight -= 1
+            return wrapper
+        return decorator
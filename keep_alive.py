@@ -1,16 +1,42 @@
-from flask import Flask
+from flask import Flask, Response, request
+import os
 import threading
 
+import metrics
+
 app = Flask(__name__)
 
+# Set by keep_alive() when updates are pushed to this replica by router.py
+_accept_update = None
+
 @app.route('/')
 def home():
     return "Bot is running!"
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Updates forwarded by router.py, carrying Telegram's secret token header along
+@app.route('/telegram', methods=['POST'])
+def telegram_update():
+    if _accept_update is None:
+        return Response(status=404)
+    secret = os.getenv("WEBHOOK_SECRET")
+    if not secret or request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+        return Response(status=403)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return Response(status=400)
+    _accept_update(data)
+    return Response(status=200)
+
 def run():
-    app.run(host='0.0.0.0', port=8080)
+    app.run(host='0.0.0.0', port=int(os.getenv("PORT", "8080")))
 
-def keep_alive():
+def keep_alive(accept_update=None):
+    global _accept_update
+    _accept_update = accept_update
     t = threading.Thread(target=run)
     t.daemon = True
     t.start()
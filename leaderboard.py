@@ -0,0 +1,75 @@
+# Order statistics over users' aura: how many users hold each aura value,
+# in a Fenwick tree so "how many users are above X" is O(log range).
+# Only counts per value are kept (no per-user state), so memory is
+# bounded by the spread of aura values, not the number of users.
+class AuraRanks:
+    def __init__(self, low=-64, high=64):
+        self.counts = {}
+        self.total = 0
+        self._build(low, high)
+
+    def _build(self, low, high):
+        self.low = low
+        self.size = high - low + 1
+        self.tree = [0] * (self.size + 1)
+        for aura, count in self.counts.items():
+            self._add_tree(aura, count)
+
+    # Grow the covered range (doubling) when an aura value falls outside it
+    def _cover(self, aura):
+        low, high = self.low, self.low + self.size - 1
+        if low <= aura <= high:
+            return
+        span = max(self.size, 1)
+        while aura < low:
+            low -= span
+            span *= 2
+        while aura > high:
+            high += span
+            span *= 2
+        self._build(low, high)
+
+    def _add_tree(self, aura, delta):
+        i = aura - self.low + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # Number of users with aura <= value
+    def count_at_or_below(self, aura):
+        if aura < self.low:
+            return 0
+        i = min(aura - self.low + 1, self.size)
+        result = 0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def add(self, aura, count=1):
+        self._cover(aura)
+        self.counts[aura] = self.counts.get(aura, 0) + count
+        if not self.counts[aura]:
+            del self.counts[aura]
+        self.total += count
+        self._add_tree(aura, count)
+
+    # A user's aura changed from old to new
+    def move(self, old, new):
+        if old != new:
+            self.add(old, -1)
+            self.add(new, 1)
+
+    # 1-based rank of a user holding this aura (ties share the best rank)
+    def rank(self, aura):
+        return self.total - self.count_at_or_below(aura) + 1
+
+    # Replace everything with fresh counts, e.g. [{"_id": aura, "count": n}, ...]
+    def load(self, groups):
+        groups = [(group["_id"] or 0, group["count"]) for group in groups]
+        self.counts = {}
+        self.total = 0
+        values = [aura for aura, _ in groups] or [0]
+        self._build(min(values), max(values))
+        for aura, count in groups:
+            self.add(aura, count)
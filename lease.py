@@ -0,0 +1,57 @@
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+
+
+# Name this process uses as a lease owner: REPLICA_ID if set, else host:pid
+def replica_id():
+    return os.getenv("REPLICA_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Time-bounded leadership stored as one document per lease in Mongo.
+# acquire() takes the lease if it is free or expired and renews it if we already hold it;
+# the conditional upsert makes that a single atomic round trip. Holders must renew well
+# inside `ttl`; a replica that stops renewing loses the lease
+# once it expires, so jobs guarded by it must be safe to re-run after a takeover.
+# Expiry uses the acquiring host's clock: hosts must agree to well within `ttl`.
+class Lease:
+    def __init__(self, collection, name, owner=None, ttl=60):
+        self.collection = collection
+        self.name = name
+        self.owner = owner or replica_id()
+        self.ttl = ttl
+        self._valid_until = 0.0
+
+    # True while we hold the lease, judged by our own clock (no round trip)
+    @property
+    def held(self):
+        return time.monotonic() < self._valid_until
+
+    def acquire(self):
+        from pymongo.errors import DuplicateKeyError
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        try:
+            self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl), "renewed_at": now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease, so the upsert tried to insert a second one
+            self._valid_until = 0.0
+            return False
+        # Count validity from before the request so we never outlive the stored expiry
+        self._valid_until = started + self.ttl
+        return True
+
+    # Give the lease up early (clean shutdown) so another replica takes over at once
+    def release(self):
+        if self.held:
+            self._valid_until = 0.0
+            self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+    def holder(self):
+        doc = self.collection.find_one({"_id": self.name})
+        return doc["owner"] if doc else None
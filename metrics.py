@@ -0,0 +1,239 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telegram.request import HTTPXRequest
+
+# Shared lock: handlers record from the asyncio thread, the Flask thread renders
+_lock = threading.Lock()
+_registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+_INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+# Monotonic counter with optional labels
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with _lock:
+            return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        with _lock:
+            return sum(self._values.values())
+
+    def collect(self):
+        with _lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}" for key, value in items]
+
+
+# Value that can go up and down (sizes, in-flight work)
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+
+# Cumulative histogram in the Prometheus exposition layout
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            state = self._values.get(key)
+            return state[2] if state else 0
+
+    def collect(self):
+        with _lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                le = f'le="{_format_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Render every registered metric in the text exposition format
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+# Metric definitions
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Time spent handling one update.", ["handler", "route"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Updates whose handler raised.", ["handler", "route"]
+)
+MONGO_COMMANDS = Counter(
+    "bot_mongo_commands_total", "MongoDB commands sent.", ["command"]
+)
+MONGO_FAILURES = Counter(
+    "bot_mongo_command_failures_total", "MongoDB commands that failed.", ["command"]
+)
+MONGO_LATENCY = Histogram(
+    "bot_mongo_command_seconds", "MongoDB command round-trip time.", ["command"]
+)
+MONGO_OPS_PER_UPDATE = Histogram(
+    "bot_mongo_ops_per_update", "MongoDB round trips made while handling one update.",
+    ["handler", "route"], buckets=COUNT_BUCKETS
+)
+MONGO_TIME_PER_UPDATE = Histogram(
+    "bot_mongo_seconds_per_update", "MongoDB time spent while handling one update.", ["handler", "route"]
+)
+TELEGRAM_CALLS = Counter(
+    "bot_telegram_api_calls_total", "Telegram Bot API requests.", ["method"]
+)
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_api_errors_total", "Telegram Bot API requests that failed.", ["method"]
+)
+TELEGRAM_LATENCY = Histogram(
+    "bot_telegram_api_seconds", "Telegram Bot API request time.", ["method"]
+)
+CACHE_REQUESTS = Counter(
+    "bot_cache_requests_total", "Cache lookups by outcome.", ["cache", "result"]
+)
+SHED_UPDATES = Counter(
+    "bot_shed_updates_total", "Updates answered without running the handler.", ["handler", "action", "reason"]
+)
+DUPLICATE_SUBMISSIONS = Counter(
+    "bot_duplicate_submissions_total", "Submitted confessions matching an earlier one.", ["kind", "action"]
+)
+UPDATE_BACKLOG = Gauge(
+    "bot_update_backlog", "Updates queued or in flight when the last update arrived."
+)
+
+
+# Record a cache lookup; hit rate = hit / (hit + miss)
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# Per-update accounting, visible to the pymongo listener (mongo_listeners.py) called from the same task
+class UpdateStats:
+    def __init__(self):
+        self.mongo_ops = 0
+        self.mongo_seconds = 0.0
+
+
+current_update = ContextVar("current_update", default=None)
+
+
+# Time a block of work (an update, a deferred flush) and attribute its Mongo work to it
+@contextmanager
+def track(name, route=""):
+    stats = UpdateStats()
+    token = current_update.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    except Exception:
+        HANDLER_ERRORS.inc(handler=name, route=route)
+        raise
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - start, handler=name, route=route)
+        MONGO_OPS_PER_UPDATE.observe(stats.mongo_ops, handler=name, route=route)
+        MONGO_TIME_PER_UPDATE.observe(stats.mongo_seconds, handler=name, route=route)
+        current_update.reset(token)
+
+
+# Decorator: track a handler per update, labelled by handler and route
+def instrument_handler(name, route=None):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            with track(name, route(update) if route else ""):
+                return await func(update, context)
+        return wrapper
+    return decorator
+
+
+# HTTPX request backend counting Bot API calls per method
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        TELEGRAM_CALLS.inc(method=api_method)
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method=api_method)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - start, method=api_method)
+        if code >= 400:
+            TELEGRAM_ERRORS.inc(method=api_method)
+        return code, payload
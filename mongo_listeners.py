@@ -0,0 +1,52 @@
+# pymongo command listeners. Kept apart from metrics.py and query_profiler.py so that
+# importing those (and bot.py) doesn't import pymongo; this is loaded with the client.
+from pymongo import monitoring
+
+import metrics
+from query_profiler import active_profiler
+
+
+# pymongo command listener feeding the Mongo metrics
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        metrics.MONGO_COMMANDS.inc(command=event.command_name)
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1_000_000
+        metrics.MONGO_LATENCY.observe(seconds, command=event.command_name)
+        stats = metrics.current_update.get()
+        if stats is not None:
+            stats.mongo_ops += 1
+            stats.mongo_seconds += seconds
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        metrics.MONGO_FAILURES.inc(command=event.command_name)
+        self._finished(event)
+
+
+# pymongo command listener; events fire in the calling thread, so the stack is the caller's
+class ProfilerListener(monitoring.CommandListener):
+    def started(self, event):
+        profiler = active_profiler.get()
+        if profiler is None:
+            return
+        collection = event.command.get(event.command_name) if event.command_name != "getMore" else event.command.get("collection")
+        record = profiler.record(event.command_name, collection if isinstance(collection, str) else "")
+        profiler._pending[event.request_id] = record
+
+    def _finished(self, event):
+        profiler = active_profiler.get()
+        if profiler is None:
+            return
+        record = profiler._pending.pop(event.request_id, None)
+        if record is not None:
+            record.seconds = event.duration_micros / 1_000_000
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
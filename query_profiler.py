@@ -0,0 +1,146 @@
+import functools
+import os
+import sys
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Collection methods that each cost at least one round trip
+PROFILED_METHODS = (
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "count_documents", "aggregate", "bulk_write",
+    "create_index", "distinct",
+)
+
+# Frames from these files are skipped when looking for the caller
+_SKIP_PATHS = (
+    os.sep + "pymongo" + os.sep,
+    os.sep + "mongomock" + os.sep,
+    os.sep + "contextlib.py",
+    os.sep + "query_profiler.py",
+    os.sep + "mongo_listeners.py",
+)
+
+active_profiler = ContextVar("active_query_profiler", default=None)
+# Set while inside a patched method so internal calls (find_one -> find) count once
+_in_patched_call = ContextVar("in_patched_call", default=False)
+
+
+# Closest frame outside the driver and this module, as "file:line in func"
+def _call_site():
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(skip in filename for skip in _SKIP_PATHS):
+            return f"{os.path.basename(filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+# One recorded Mongo command
+class QueryRecord:
+    def __init__(self, command, collection, call_site):
+        self.command = command
+        self.collection = collection
+        self.call_site = call_site
+        self.seconds = 0.0
+
+
+# Collects the commands issued while it is active
+class QueryProfiler:
+    def __init__(self, label=""):
+        self.label = label
+        self.records = []
+        self._pending = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = active_profiler.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        active_profiler.reset(self._token)
+        return False
+
+    @property
+    def count(self):
+        return len(self.records)
+
+    def record(self, command, collection, call_site=None):
+        record = QueryRecord(command, collection, call_site or _call_site())
+        self.records.append(record)
+        return record
+
+    def by_call_site(self):
+        return TallyCounter(r.call_site for r in self.records)
+
+    def report(self):
+        title = f"{self.count} Mongo commands" + (f" for {self.label}" if self.label else "")
+        lines = [title]
+        details = {}
+        for r in self.records:
+            details.setdefault(r.call_site, TallyCounter())[f"{r.command} {r.collection}"] += 1
+        for site, total in self.by_call_site().most_common():
+            ops = ", ".join(f"{n}x {op}" for op, n in details[site].most_common())
+            lines.append(f"  {total:>4}  {site}  ({ops})")
+        return "\n".join(lines)
+
+
+# mongomock has no command monitoring; wrap its Collection methods instead
+@contextmanager
+def patch_collection_class(collection_class):
+    originals = {}
+    for name in PROFILED_METHODS:
+        method = getattr(collection_class, name, None)
+        if method is None:
+            continue
+        originals[name] = method
+
+        def wrapper(self, *args, _method=method, _name=name, **kwargs):
+            profiler = active_profiler.get()
+            if profiler is None or _in_patched_call.get():
+                return _method(self, *args, **kwargs)
+            record = profiler.record(_name, self.name)
+            token = _in_patched_call.set(True)
+            start = time.perf_counter()
+            try:
+                return _method(self, *args, **kwargs)
+            finally:
+                record.seconds = time.perf_counter() - start
+                _in_patched_call.reset(token)
+        setattr(collection_class, name, functools.wraps(method)(wrapper))
+    try:
+        yield
+    finally:
+        for name, method in originals.items():
+            setattr(collection_class, name, method)
+
+
+# Test helper: fail if the block issues more than `limit` Mongo commands
+@contextmanager
+def assert_max_queries(limit, label=""):
+    with QueryProfiler(label) as profiler:
+        yield profiler
+    if profiler.count > limit:
+        raise AssertionError(f"Expected at most {limit} Mongo commands, got {profiler.count}\n{profiler.report()}")
+
+
+# Decorator: when QUERY_PROFILE is set, print a per-update report for the handler
+def profile_update(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            if not os.getenv("QUERY_PROFILE"):
+                return await func(update, context)
+            label = name
+            if update.callback_query:
+                label = f"{name} ({update.callback_query.data})"
+            with QueryProfiler(label) as profiler:
+                try:
+                    return await func(update, context)
+                finally:
+                    print(profiler.report())
+        return wrapper
+    return decorator
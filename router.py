@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sys
+
+import httpx
+from dotenv import load_dotenv
+from flask import Flask, Response, request
+
+# Public webhook endpoint for several bot replicas (UPDATE_SOURCE=router).
+# Every update from the same user goes to the same replica, so the per-user
+# conversation state each replica keeps in memory (context.user_data) stays correct.
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# URL Telegram should post to, i.e. this router's /telegram behind TLS
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Base URLs of the replicas' keep-alive servers, e.g. http://10.0.0.5:8080,http://10.0.0.6:8080
+REPLICA_URLS = [url.strip().rstrip("/") for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+
+app = Flask(__name__)
+client = httpx.Client(timeout=5)
+
+# Who an update belongs to: the user who caused it, else its chat
+def routing_key(update):
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        owner = value.get("from") or value.get("user") or value.get("chat") or (value.get("message") or {}).get("chat")
+        if owner:
+            return owner["id"]
+    return update.get("update_id", 0)
+
+# Rendezvous hashing: each key ranks the replicas in a fixed order, so adding or
+# removing a replica only moves the users whose first choice it was
+def replica_order(key, replicas=None):
+    replicas = REPLICA_URLS if replicas is None else replicas
+    return sorted(
+        replicas,
+        key=lambda url: hashlib.blake2b(f"{key}@{url}".encode(), digest_size=8).digest(),
+        reverse=True
+    )
+
+@app.route('/telegram', methods=['POST'])
+def telegram_webhook():
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return Response(status=403)
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        return Response(status=400)
+    headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+    # Fall through to the next replica in the user's order if their first choice is down
+    for url in replica_order(routing_key(update)):
+        try:
+            response = client.post(f"{url}/telegram", content=request.get_data(), headers=headers)
+        except httpx.HTTPError as e:
+            print(f"Replica {url} unreachable: {e}")
+            continue
+        # Only a 2xx means the replica queued it; a 4xx (e.g. a secret mismatch) would drop it
+        if response.is_success:
+            return Response(status=200)
+        print(f"Replica {url} answered {response.status_code}")
+    # Telegram retries the update later
+    return Response(status=503)
+
+@app.route('/')
+def home():
+    return f"Routing to {len(REPLICA_URLS)} replicas"
+
+def set_webhook():
+    params = {"url": WEBHOOK_URL, "secret_token": WEBHOOK_SECRET}
+    response = httpx.post(f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook", data=params)
+    print(f"setWebhook: {response.text}")
+
+if __name__ == "__main__":
+    # Replicas refuse forwarded updates without it
+    if not WEBHOOK_SECRET:
+        sys.exit("WEBHOOK_SECRET must be set, to the same value as on the replicas")
+    set_webhook()
+    app.run(host='0.0.0.0', port=int(os.getenv("PORT", "8443")), threaded=True)
@@ -0,0 +1,103 @@
+import time
+
+# Event weights: a new comment says more about interest than a tap
+COMMENT_WEIGHT = 3.0
+REPLY_WEIGHT = 2.0
+REACTION_WEIGHT = 1.0
+
+# Scores below this (decayed to now) are forgotten at snapshot time
+PRUNE_BELOW = 0.01
+# Rebase once boost factors reach 2**REBASE_AFTER to keep floats well in range
+REBASE_AFTER = 64
+
+
+# Time-decayed engagement score per confession with a bounded top-K.
+# Uses forward decay: an event at time t adds weight * 2**((t - epoch) / half_life),
+# so stored scores never need decaying and their order is the order of decayed scores.
+class TrendingTracker:
+    def __init__(self, half_life=6 * 3600, size=20, now=None):
+        self.half_life = half_life
+        self.size = size
+        self.epoch = time.time() if now is None else now
+        self.scores = {}
+        self.top = {}
+        # Top scores saved by other replicas (relative to our epoch); see set_peers
+        self.peers = {}
+
+    def _boost(self, now):
+        return 2 ** ((now - self.epoch) / self.half_life)
+
+    def _rebase(self, now):
+        factor = 1 / self._boost(now)
+        self.scores = {cid: score * factor for cid, score in self.scores.items()}
+        self.top = {cid: score * factor for cid, score in self.top.items()}
+        self.peers = {cid: score * factor for cid, score in self.peers.items()}
+        self.epoch = now
+
+    # Record an engagement event for a confession
+    def record(self, confession_id, weight, now=None):
+        now = time.time() if now is None else now
+        if (now - self.epoch) / self.half_life > REBASE_AFTER:
+            self._rebase(now)
+        score = self.scores.get(confession_id, 0.0) + weight * self._boost(now)
+        self.scores[confession_id] = score
+        self._offer(confession_id, score)
+
+    # Keep the top-K map current; O(K) only when an outsider displaces the minimum
+    def _offer(self, confession_id, score):
+        if confession_id in self.top or len(self.top) < self.size:
+            self.top[confession_id] = score
+            return
+        lowest = min(self.top, key=self.top.get)
+        if score > self.top[lowest]:
+            del self.top[lowest]
+            self.top[confession_id] = score
+
+    # Top confessions as (confession_id, score decayed to now), hottest first.
+    # With peers, candidates are our top-K plus theirs, scored by the sum across replicas.
+    def trending(self, limit=None, now=None):
+        now = time.time() if now is None else now
+        scale = 1 / self._boost(now)
+        if self.peers:
+            candidates = {cid: self.scores.get(cid, 0.0) + self.peers.get(cid, 0.0) for cid in {**self.top, **self.peers}}
+        else:
+            candidates = self.top
+        ranked = sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+        return [(cid, score * scale) for cid, score in ranked[:limit or self.size]]
+
+    # Drop confessions whose decayed score is negligible and not in the top-K
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        threshold = PRUNE_BELOW * self._boost(now)
+        self.scores = {cid: score for cid, score in self.scores.items() if score >= threshold or cid in self.top}
+
+    # Serialisable state for Mongo
+    def snapshot(self, now=None):
+        self.prune(now)
+        return {
+            "epoch": self.epoch,
+            "half_life": self.half_life,
+            "scores": [{"confession_id": cid, "score": score} for cid, score in self.scores.items()],
+        }
+
+    # Replace the peer scores with the top-K of other replicas' snapshots
+    def set_peers(self, docs):
+        peers = {}
+        for doc in docs:
+            factor = 2 ** ((doc["epoch"] - self.epoch) / self.half_life)
+            entries = sorted(doc.get("scores", []), key=lambda entry: entry["score"], reverse=True)
+            for entry in entries[:self.size]:
+                cid = entry["confession_id"]
+                peers[cid] = peers.get(cid, 0.0) + entry["score"] * factor
+        self.peers = peers
+
+    def restore(self, doc):
+        if not doc:
+            return
+        factor = 2 ** ((doc["epoch"] - self.epoch) / self.half_life)
+        self.scores = {}
+        self.top = {}
+        for entry in doc.get("scores", []):
+            score = entry["score"] * factor
+            self.scores[entry["confession_id"]] = score
+            self._offer(entry["confession_id"], score)